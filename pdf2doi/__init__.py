@@ -15,7 +15,9 @@ from .config import config
 config.ReadParamsINIfile()  #Load all current configuration from the .ini file. If the .ini file is not present, it generates it using default values
 
 #Determine the list of libraries to be used to extract text from pdf files
-reader_libraries = ['PyPdf','pdfminer'] 
+reader_libraries = ['PyMuPDF','PyPdf','pdfminer'] 
+# PyMuPDF (which is already required to find the title of the file) extracts the text with the native library MuPDF, and it is more than 
+# ten times faster than the other libraries. Hence it is used first, and the other libraries are used only if it does not find any identifier.
 # Using PyPdf before pdfminer makes sure that, in arxiv pdf files, the DOI which is sometimes written on the left margin of the first page is correctly detected
 
 is_textract_installed = importlib.util.find_spec('textract')
@@ -26,8 +28,22 @@ if is_textract_installed:
 config.set('verbose',config.get('verbose')) #This is a quick and dirty way (to improve in the future) to make sure that the verbosity of the pdf2doi logger is properly set according
                                             #to the current value of config.get('verbose') (see config.py file for details)
 from .main import pdf2doi, pdf2doi_singlefile
-from .finders import *
+#from .finders import *   The functions defined in finders.py are still accessible as pdf2doi.<function name>, but the module finders
+#                         (and the heavy libraries it depends on) is imported only the first time that one of them is needed (see __getattr__ below)
 #from .bibtex_makers import *
-from .utils_registry import install_right_click, uninstall_right_click
+#from .utils_registry import install_right_click, uninstall_right_click   These are also imported only when needed (see __getattr__ below)
 
 
+def __getattr__(name):
+    if name.startswith('__'):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    if name in ('install_right_click', 'uninstall_right_click'):
+        return getattr(importlib.import_module('.utils_registry', __name__), name)
+    finders = importlib.import_module('.finders', __name__)
+    if name == 'finders':
+        return finders
+    try:
+        return getattr(finders, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
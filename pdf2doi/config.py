@@ -2,6 +2,8 @@ import configparser
 import os
 import logging
 
+logger = logging.getLogger("pdf2doi")
+
 ''' 
 method_dxdoiorg                         It sets which method is used when querying dx.doi.org to retrieve the bibtex info
                                         Two possible values are 'text/bibliography; style=bibtex' , 'application/x-bibtex' and
@@ -27,6 +29,25 @@ numb_results_google_search              How many results should it look into whe
 
 N_characters_in_pdf
 
+min_characters_to_skip_textract         When looking for an identifier in the text of a pdf file, the library textract (if installed) is not used 
+                                        if any of the other libraries already extracted at least this number of characters from the file
+
+workers                                 How many pdf files are analysed at the same time (each one by a different thread) when
+                                        the target of pdf2doi is a folder
+
+use_processes                           If set True, the pdf files of a folder are analysed by a pool of config.get('workers') processes, 
+                                        instead of threads. This is useful when most of the time is spent extracting the text of the files
+
+recursive                               If set True, when the target of pdf2doi is a folder, the pdf files contained in all its subfolders
+                                        are also analysed
+
+sort_files_by_inode                     If set True, the pdf files of a folder are analysed in the order of their inode numbers, which 
+                                        reduces the seek times on hard disks
+
+use_cache                               If set True, the identifiers found are stored in a cache on disk (see results_cache.py), and they are 
+                                        read from there when pdf2doi is called again on the same (unmodified) file. It is False by default, also
+                                        from command line (where it can be set True with the argument -cache)
+
 save_identifier_metadata                Sets the default value of the global setting save_identifier_metadata
                                         If set True, when a valid identifier is found with any method different than the metadata lookup the identifier
                                         is also written inside the file metadata with key "/identifier". If set False, this does not happen.
@@ -44,6 +65,12 @@ class config():
             'websearch' : True,
             'numb_results_google_search' : 6,
             'N_characters_in_pdf' : 1000,
+            'min_characters_to_skip_textract' : 2000,
+            'workers' : 1,
+            'use_processes' : False,
+            'recursive' : False,
+            'sort_files_by_inode' : False,
+            'use_cache' : False,
             'save_identifier_metadata' : True,
             'replace_arxivID_by_DOI_when_available' : True
             }
@@ -54,6 +81,10 @@ class config():
     def update_params(new_params):
         config.__params.update(new_params)
 
+    @staticmethod
+    def get_params():
+        return dict(config.__params)
+
     @staticmethod
     def get(name):
         return config.__params[name]
@@ -69,7 +100,6 @@ class config():
             # We change the logger verbosity
             if value: loglevel = logging.INFO
             else: loglevel = logging.CRITICAL
-            logger = logging.getLogger("pdf2doi")
             logger.setLevel(level=loglevel)
 
     @staticmethod
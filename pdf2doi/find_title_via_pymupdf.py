@@ -119,10 +119,10 @@ def headers_para(doc, size_tag):
     return header_para
 
 def find_title_via_pymupdf(file):
-    doc = fitz.open(file)
-    font_counts, styles = fonts(doc, granularity=False)
-    size_tag = font_tags(font_counts, styles)
-    elements = headers_para(doc, size_tag)
+    with fitz.open(file) as doc:
+        font_counts, styles = fonts(doc, granularity=False)
+        size_tag = font_tags(font_counts, styles)
+        elements = headers_para(doc, size_tag)
     for e in elements:
         if e.startswith('<h1>'):
             return (e.lstrip("<h1>")).replace("|", "")
\ No newline at end of file
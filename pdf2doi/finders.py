@@ -5,35 +5,147 @@ The module is divided in two parts. The first part contains low-level functions.
 any part of the main script main.py. Instead, they are called by the high-level finder functions, defined in the second part of 
 this module.
 """
-from urllib.parse import unquote
+from urllib.parse import unquote, quote
 from itertools import accumulate
-from pypdf import PdfWriter
-from PyPDF2 import PdfFileReader, PdfFileWriter
-from pdfminer.high_level import extract_text
+from pypdf import PdfReader, PdfWriter
+#pdfminer, pdftitle and googlesearch are imported only when they are needed (i.e. in _extract_pdf_text, find_possible_titles and
+#find_identifier_in_google_search), since most files are identified before any of them is used
 
 import requests
-import pdftitle
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import logging
-from googlesearch import search
 import pdf2doi.config as config
 from pdf2doi import reader_libraries
 from pdf2doi.find_title_via_pymupdf import find_title_via_pymupdf
+import fitz
 import os
+import io
+import types
+import difflib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import feedparser
 
 from pdf2doi.patterns import (
-    arxiv2007_pattern,
     doi_regexp,
     arxiv_regexp,
+    doi_regexp_compiled,
+    arxiv_regexp_compiled,
+    doi_required_substring,
+    arxiv_required_regexp,
+    pdf_extensions,
     standardise_doi#,
     #isbn_regexp
 )
 
 logger = logging.getLogger('pdf2doi')
 
+#All the HTTP requests performed by this module go through the same requests.Session, so that the TCP/TLS connections
+#to a given host (e.g. dx.doi.org or export.arxiv.org) are kept alive and re-used, instead of being re-opened for each request
+session = requests.Session()
+
+def set_http_pool_size(size):
+    """
+    Sets how many connections to the same host can be kept open at the same time by the session used for all HTTP requests.
+    It must be at least equal to the number of threads which might be sending requests at the same time (see main.py), otherwise
+    the connections in excess are closed (and re-opened at the next request) instead of being re-used.
+    """
+    size = max(16, size)
+    if session.get_adapter('https://').poolmanager.connection_pool_kw.get('maxsize') == size:
+        return #The current adapter (and its open connections) is kept
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=size, max_retries=Retry(total=2, backoff_factor=0.3))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+set_http_pool_size(16)
+http_timeout = (5,30) #(connect, read) timeouts in seconds used for all HTTP requests
+
+#dx.doi.org answers each query by redirecting it to the registration agency of the DOI (e.g. Crossref or DataCite), which is the same
+#for all DOIs with the same prefix (e.g. '10.1103'). The first time that a DOI is validated, the url of its agency is stored in this dictionary
+#and the following DOIs with the same prefix are sent there directly, saving one request. The keys are tuples (prefix, method) and the values
+#are tuples (part of the url before the DOI, part of the url after the DOI, characters not percent-encoded in the DOI). See remember_doi_agency
+doi_agency_url_cache = {}
+
+#The results of the queries done to validate an identifier online are stored in this dictionary, so that the same identifier
+#(which typically appears several times in the same file, e.g. in the metadata and in the text) is never validated twice.
+#The keys are tuples (identifier, method), where method is either the format requested to dx.doi.org or 'arxiv'.
+#Failed connections are not stored, so that they can be attempted again. Identifiers not found online are stored (with value None), so that
+#they are not queried again. In order to limit the memory used when analysing large folders, the dictionary is emptied when it contains 
+#more than max_entries_web_validation_cache elements (see store_web_validation)
+web_validation_cache = {}
+max_entries_web_validation_cache = 4096
+
+def store_web_validation(key,result):
+    if len(web_validation_cache) >= max_entries_web_validation_cache:
+        web_validation_cache.clear()
+    web_validation_cache[key] = result
+
+def clear_validation_cache():
+    """
+    Forgets the results of all the online validations done so far, so that the next validation of any identifier queries the web again.
+    """
+    web_validation_cache.clear()
+
+class _NonTextCharactersTable(dict):
+    '''
+    Translation table (to be used with str.translate) which replaces any non-ASCII character, newline, carriage return 
+    and tab with a space, and leaves all the other characters unchanged. The table is filled lazily, the first time that a given
+    character is encountered, so that str.translate can clean a text in a single pass.
+    '''
+    def __missing__(self, codepoint):
+        value = ord(' ') if (codepoint > 0x7f or chr(codepoint) in "\n\r\t") else codepoint
+        self[codepoint] = value
+        return value
+
+non_text_characters_table = _NonTextCharactersTable()
+
+#Quick sanity checks performed by the function validate on a candidate identifier, before any online validation.
+#The registrant code of a DOI (the digits after '10.') has at least 4 digits, and the number after the dot of an arXiv ID
+#(in use after 2007) has either 4 or 5 digits. Candidates which do not pass these checks are discarded without querying any website.
+doi_sanity_regexp = re.compile(r'^10\.\d{4,9}/\S+$')
+arxiv_sanity_regexp = re.compile(r'^(\d{4}\.\d{4,5})(?:v\d+)?$',re.I)
+max_length_identifier = 256
+
+#The outcome of find_identifier_in_text for short strings (shorter than max_length_memoized_text characters) is stored in this
+#dictionary. The keys are tuples (text, func_validate, config.get('webvalidation'), config.get('method_dxdoiorg')). The dictionary is 
+#emptied when it contains more than max_entries_text_identifier_cache elements
+text_identifier_cache = {}
+max_length_memoized_text = 1000
+max_entries_text_identifier_cache = 4096
+
+#If the library hyperscan is installed, all the regexps in doi_regexp and arxiv_regexp are compiled into a single database, which
+#allows to find out, with a single pass over a text, which regexps have at least one match in it (see find_matching_regexps). 
+#The regexps without any match are then skipped in find_identifier_in_text. 
+#Hyperscan does not support possessive quantifiers, which are replaced by standard ones. This does not change which regexps
+#have a match (see patterns.py).
+try:
+    import hyperscan
+    _expressions = doi_regexp + arxiv_regexp
+    hyperscan_database = hyperscan.Database()
+    hyperscan_database.compile(expressions = [e.replace('++','+').encode() for e in _expressions],
+                               ids = list(range(len(_expressions))),
+                               flags = [hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH | 
+                                        hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP] * len(_expressions))
+except Exception:
+    hyperscan_database = None
+
 ######## Beginning first part, low-level functions ######## 
 
+def remember_doi_agency(doi, method, url):
+    """
+    Given a doi and the url to which dx.doi.org redirected the query for this doi, it stores the url of the registration agency in
+    doi_agency_url_cache (only if the doi can be found inside the url).
+    """
+    prefix = doi.split('/')[0]
+    for safe in ('', '/'):
+        encoded_doi = quote(doi, safe=safe)
+        index = url.lower().find(encoded_doi.lower())
+        if index >= 0:
+            doi_agency_url_cache[(prefix,method)] = (url[:index], url[index+len(encoded_doi):], safe)
+            return
+
 def validate_doi_web(doi,method=None):
     """ It queries dx.doi.org for a certain doi, to check that the doi exists.
     If dx.doi.org could not find any paper associated to this doi, the function returns None
@@ -43,13 +155,21 @@ def validate_doi_web(doi,method=None):
     """
     if method == None:
         method = config.get('method_dxdoiorg')
+    if (doi,method) in web_validation_cache:
+        return web_validation_cache[(doi,method)]
     try:
         # TODO(DJRHails): This should really use the handle API (https://www.doi.org/factsheets/DOIProxy.html)
-        url = "https://dx.doi.org/" + doi
+        # If the registration agency of DOIs with this prefix is already known, the query is sent directly to it (see doi_agency_url_cache)
+        prefix = doi.split('/')[0]
+        agency_url = doi_agency_url_cache.get((prefix,method))
+        if agency_url:
+            url = agency_url[0] + quote(doi, safe=agency_url[2]) + agency_url[1]
+        else:
+            url = "https://dx.doi.org/" + doi
         headers = {"accept": method}
         NumberAttempts = 10
         while NumberAttempts:
-            r = requests.get(url, headers = headers)
+            r = session.get(url, headers = headers, timeout = http_timeout)
             r.encoding = 'utf-8' #This forces to encode the obtained text with utf-8
             text = r.text
             # 503 or 504 errors are common
@@ -62,13 +182,16 @@ def validate_doi_web(doi,method=None):
 
             # 404 = DOI Not Found, or DOI Prefix Not Found
             if r.status_code == 404:
-                return None
-
+                result = None
             # Backup check for HTML error page content
-            if text.lower().find("DOI cannot be found".lower()) != -1:
-                return None
-                
-            return text
+            elif text.lower().find("DOI cannot be found".lower()) != -1:
+                result = None
+            else:
+                result = text
+                if not agency_url and r.history:
+                    remember_doi_agency(doi, method, r.url)
+            store_web_validation((doi,method),result)
+            return result
     except Exception as e:
         logger.error(r"Some error occured within the function validate_doi_web")
         logger.error(e)
@@ -80,15 +203,18 @@ def validate_arxivID_web(arxivID):
     If it was not possible to connect to export.arxiv.org, the function returns -1
     If export.arxiv.org confirmed that DOI exists, the function returns the data obtained from export.arxiv.org
     """
+    if (arxivID,'arxiv') in web_validation_cache:
+        return web_validation_cache[(arxivID,'arxiv')]
     try:
         url = "http://export.arxiv.org/api/query?search_query=id:" + arxivID
-        result = feedparser.parse(url)
+        r = session.get(url, timeout = http_timeout)
+        result = feedparser.parse(r.text)
         items = result.entries[0]
         found = len(items) > 0
         if not found: 
-            return None
-        else:
-            return items
+            items = None
+        store_web_validation((arxivID,'arxiv'),items)
+        return items
     except Exception as e:
         logger.error(r"Some error occured within the function arxiv2bib")
         logger.error(e)
@@ -114,11 +240,16 @@ def validate(identifier,what='doi'):
     """  
     if not identifier:
         return None
+    if len(identifier) > max_length_identifier:
+        return False
     if what=='doi':
         standard_doi = standardise_doi(identifier)
         if identifier != standard_doi:
             logger.info(f"Standardised DOI: {identifier} -> {standard_doi}")
 
+        if standard_doi and not doi_sanity_regexp.match(standard_doi):
+            logger.info(f"The string {standard_doi} does not have the structure of a valid DOI.")
+            return False
         if standard_doi:
             if config.get('webvalidation'):
                 logger.info(f"Validating the possible DOI {standard_doi} via a query to dx.doi.org...")
@@ -141,7 +272,7 @@ def validate(identifier,what='doi'):
         else: return False
 
     elif what=='arxiv':
-        if re.match(arxiv2007_pattern,identifier,re.I):
+        if arxiv_sanity_regexp.match(identifier):
             if config.get('webvalidation'):
                 logger.info(f"Validating the possible arxiv ID {identifier} via a query to export.arxiv.org...")
                 result = validate_arxivID_web(identifier)
@@ -186,6 +317,30 @@ def validate(identifier,what='doi'):
     return False
 
 
+def find_matching_regexps(text):
+    """
+    If the library hyperscan is installed, it returns the set of the indices (in the list doi_regexp + arxiv_regexp) of the
+    regexps which have at least one match in the input argument 'text'. All regexps are matched with a single pass over the text. 
+    If hyperscan is not installed, the returned set contains the indices of all the doi regexps only if the text contains the substring 
+    doi_required_substring, and the indices of all the arxiv regexps only if the text matches arxiv_required_regexp (see patterns.py).
+    If the scan fails, it returns None.
+    """
+    if hyperscan_database is None:
+        matching = set()
+        if doi_required_substring in text:
+            matching.update(range(len(doi_regexp)))
+        if arxiv_required_regexp.search(text):
+            matching.update(range(len(doi_regexp), len(doi_regexp) + len(arxiv_regexp)))
+        return matching
+    matching = set()
+    def on_match(id, start, end, flags, context):
+        matching.add(id)
+    try:
+        hyperscan_database.scan(text.encode('utf-8'), match_event_handler=on_match)
+    except Exception:
+        return None
+    return matching
+
 def extract_arxivID_from_text(text,version=0):   
     """
     It looks for an arxiv ID in the input argument 'text', by using the regexp specified by arxiv_regexp[version],
@@ -205,7 +360,7 @@ def extract_arxivID_from_text(text,version=0):
         It returns a list of all arXiv IDs found (or empty list if no ID was found)
     """   
     try:                                            
-        arxiv_ids = re.findall(arxiv_regexp[version] ,text,re.I)
+        arxiv_ids = re.findall(arxiv_regexp[version],text,re.I)
         return arxiv_ids
     except:
         pass
@@ -263,6 +418,50 @@ def extract_doi_from_text(text,version=0):
 #        pass
 #    return []
 
+def find_identifier_in_crossref_search(title,func_validate,numb_results=3,min_similarity=0.9):
+    """
+    It queries the API of Crossref (api.crossref.org) for publications matching the string title. The DOIs of the results
+    whose title is similar enough to the input title are then validated with the function func_validate.
+    A single query to Crossref returns the DOIs of the results directly, so this is much cheaper than a google search
+    (which requires downloading each search result).
+
+    Parameters
+    ----------
+    title : string
+        Possible title of the publication
+    func_validate : function
+        See the docstring of the function find_identifier_in_text
+    numb_results : int, optional
+        Number of results requested to Crossref
+    min_similarity : float, optional
+        Minimum similarity (between 0 and 1, as defined by difflib.SequenceMatcher) between the input title and the title 
+        of a result, for the DOI of the result to be considered
+    Returns
+    -------
+    identifier, desc, validation : see the docstring of the function find_identifier_in_text
+    """
+    normalise = lambda text: " ".join(re.sub(r'[^a-z0-9]+',' ',text.lower()).split())
+    logger.info(f"Looking for the title \"{title}\" in the Crossref database...")
+    try:
+        r = session.get("https://api.crossref.org/works", 
+                        params = {'query.bibliographic':title, 'rows':numb_results, 'select':'DOI,title'}, 
+                        timeout = http_timeout)
+        items = r.json()['message']['items']
+    except Exception as e:
+        logger.error(f"Some error occured while querying Crossref: {e}")
+        return None, None, None
+    for item in items:
+        if not item.get('title') or not item.get('DOI'):
+            continue
+        similarity = difflib.SequenceMatcher(None, normalise(title), normalise(item['title'][0])).ratio()
+        if similarity >= min_similarity:
+            logger.info(f"Crossref returned a publication with a matching title: \"{item['title'][0]}\"")
+            identifier,desc,info = find_identifier_in_text([item['DOI']],func_validate)
+            if identifier:
+                return identifier,desc,info
+    logger.info(f"Crossref did not return any publication with a matching title.")
+    return None, None, None
+
 def find_identifier_in_google_search(query,func_validate,numb_results):
     headers = {"User-Agent":"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.97 Safari/537.36"}
 
@@ -273,39 +472,65 @@ def find_identifier_in_google_search(query,func_validate,numb_results):
         query_to_display = query
     logger.info(f"Performing google search with key \"" + query_to_display + "\"")
     logger.info(f"and looking at the first {numb_results} results...")
-    i=1
+    from googlesearch import search
     try:
-        for url in search(query, stop=numb_results):
+        urls = list(dict.fromkeys(search(query, stop=numb_results))) #The search results are collected, removing any duplicate URL
+    except Exception: 
+        logger.exception('Some error occured while doing a google search (maybe the string is too long?)')
+        return None, None, None
+    if not urls:
+        return None, None, None
+
+    #The requests to all search results are sent concurrently, so that the connections to the different websites are established
+    #in parallel. The results are however analysed in the same order as they were returned by google, and the body of each result
+    #is downloaded (and analysed) only when it is its turn (see find_identifier_in_response).
+    executor = ThreadPoolExecutor(max_workers=len(urls))
+    responses = [executor.submit(session.get,url,headers=headers,stream=True,timeout=http_timeout) for url in urls]
+    try:
+        for i, (url, response) in enumerate(zip(urls,responses), start=1):
             identifier,desc,info = find_identifier_in_text([url],func_validate)
-            if identifier: 
+            if identifier:
                 logger.info(f"A valid {desc} was found in the URL of the search result #{str(i)} : {url}")
                 return identifier,desc,info
             logger.info(f"Looking for a valid identifier in the search result #{str(i)} : {url}")
-            response = requests.get(url,headers=headers)
-            text = response.text
-            identifier,desc,info = find_identifier_in_text(text,func_validate)
-            if identifier: 
+            try:
+                identifier,desc,info = find_identifier_in_response(response.result(),func_validate)
+            except Exception as e:
+                logger.error(f"Some error occured while downloading the search result #{str(i)}: {e}")
+                continue
+            if identifier:
                 return identifier,desc,info
-            i=i+1
-    except Exception: 
-        logger.exception('Some error occured while doing a google search (maybe the string is too long?)')
+    finally:
+        #The requests not started yet are cancelled. The ones still in progress are not waited for, and their responses are 
+        #closed (releasing their connections) as soon as they arrive
+        executor.shutdown(wait=False, cancel_futures=True)
+        for response in responses:
+            response.add_done_callback(close_response)
     return None, None, None
 
-def find_identifier_in_text(texts,func_validate):
+def close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+def find_identifier_in_text(texts,func_validate,memoize=True):
     """
     Given any string (or list of strings), it looks for any pattern which matches a valid identifier (e.g. a DOi or an arXiv ID). 
     If a list of string is passed as an argument, they are checked in the order in which they appear in the list, 
-    and the function stops as soon as a valid identifier is found.
+    and the function stops as soon as a valid identifier is found. A generator of strings can also be passed, in which case
+    the strings are consumed one at a time and the generator is not consumed further once a valid identifier is found.
 
     Parameters
     ----------
-    texts : string or a list of strings
+    texts : string, list of strings or generator of strings
        text to analyse.
     func_validate : function
         The function func_validate is used to validate any identifier that is found. 
         It must take two input arguments, first one being the identifier to validate and the second one being the type
         of identifier (e.g. 'doi,''arxiv') and return False when the identifier is not valid and either True or a non-empty string
         when the identifier is valid. For most application func_validate can be set equal to the function validate defined in this same module.  
+    memoize : bool, optional
+        If False, the outcome of the analysis of short strings is neither read from nor stored in text_identifier_cache. This is used
+        for strings which are unlikely to be analysed again (e.g. chunks of the body of a web page).
         
     Returns
     -------
@@ -318,49 +543,222 @@ def find_identifier_in_text(texts,func_validate):
         publication. Otherwise, it is just equal to True
 
     """
-    if not isinstance(texts,list): texts = [texts]
-    
+    if not isinstance(texts,(list,types.GeneratorType)): texts = [texts]
+
+    #The same identifier is often matched by several regexps, or appears several times in the texts. Each candidate is
+    #validated only once, the candidates already checked are stored in this dictionary together with the outcome of their validation
+    checked = {}
+
     for text in texts:
 
         if isinstance(text, bytes):
             text = text.decode()
 
-        #First we look for DOI
-        for v in range(len(doi_regexp)):
-            identifiers = extract_doi_from_text(text,version=v)
-            for identifier in identifiers:
-                logger.debug("Found a potential DOI: " + identifier)
-                validation = func_validate(identifier,'doi')
-                standard_doi = standardise_doi(identifier)
-                if identifier != standard_doi:
-                    logger.info(f"Standardised DOI: {identifier} -> {standard_doi}")
-
-                if validation: 
-                    return standard_doi, 'DOI', validation
-            
-        #Then we look for an Arxiv ID
-        for v in range(len(arxiv_regexp)):
-            identifiers = extract_arxivID_from_text(text,version=v)
-            for identifier in identifiers:
-                validation = func_validate(identifier,'arxiv')
-                if validation:
-                    return identifier,'arxiv ID', validation
-
-        ##Then we look for ISBNs
-        #for v in range(len(isbn_regexp)):
-        #    identifiers = extract_isbn_from_text(text,version=v)
-        #    for identifier in identifiers:
-        #        validation = func_validate(identifier,'isbn')
-        #        if validation:
-        #            return identifier,'isbn', validation
+        #The outcome of the analysis of short strings (file names, metadata, URLs of search results) is memoized, since the same
+        #strings are often analysed several times (e.g. the same URL returned by different google searches)
+        memoize_text = memoize and isinstance(text,str) and len(text) <= max_length_memoized_text
+        if memoize_text:
+            key = (text, func_validate, config.get('webvalidation'), config.get('method_dxdoiorg'))
+            result = text_identifier_cache.get(key)
+            if result is not None:
+                if result[0]:
+                    return result
+                continue
+
+        result, definitive = _find_identifier_in_single_text(text,func_validate,checked)
+        if memoize_text and definitive:
+            if len(text_identifier_cache) >= max_entries_text_identifier_cache:
+                text_identifier_cache.clear()
+            text_identifier_cache[key] = result
+        if result[0]:
+            return result
+
+    return None, None, None
+
+def _find_identifier_in_single_text(text,func_validate,checked):
+    """
+    Looks for a valid identifier in a single string. See find_identifier_in_text. The dictionary 'checked' contains the identifiers
+    which have already been validated, together with the outcome of their validation, and it is updated by this function.
+    A candidate already in 'checked' is not validated again.
+
+    Returns
+    -------
+    (identifier, desc, validation) : tuple
+        See find_identifier_in_text
+    definitive : bool
+        False if the validation of any candidate in the text returned None (e.g. because it was not possible to connect to dx.doi.org),
+        also when this happened while analysing a previous text, in which case the outcome might be different if the same text is analysed again
+    """
+    definitive = True
+    #The compiled regexps are case-sensitive and must be applied to lowercase text (see patterns.py). The text is lowered only once here, 
+    #instead of letting each regexp fold the case of each character. Note that the identifiers found are therefore lowercase, while
+    #extract_doi_from_text and extract_arxivID_from_text (which use case-insensitive regexps) return them with their original case
+    if isinstance(text,str):
+        text = text.lower()
+        matching = find_matching_regexps(text)
+    else:
+        matching = None
+
+    #First we look for DOI
+    for v in range(len(doi_regexp)):
+        if matching is not None and not v in matching:
+            continue
+        try:
+            identifiers = doi_regexp_compiled[v].findall(text)
+        except Exception:
+            identifiers = []
+        for identifier in identifiers:
+            standard_doi = standardise_doi(identifier)
+            #The candidates which cannot be standardised are not deduplicated, but they are still passed to func_validate
+            if standard_doi and ('doi',standard_doi) in checked:
+                if checked[('doi',standard_doi)] is None:
+                    definitive = False
+                continue
+            logger.debug("Found a potential DOI: %s", identifier)
+            validation = func_validate(identifier,'doi')
+            if standard_doi:
+                checked[('doi',standard_doi)] = validation
+
+            if validation:
+                return (standard_doi or identifier, 'DOI', validation), True
+            if validation is None:
+                definitive = False
+
+    #Then we look for an Arxiv ID
+    for v in range(len(arxiv_regexp)):
+        if matching is not None and not (len(doi_regexp) + v) in matching:
+            continue
+        try:
+            identifiers = arxiv_regexp_compiled[v].findall(text)
+        except Exception:
+            identifiers = []
+        for identifier in identifiers:
+            if ('arxiv',identifier) in checked:
+                if checked[('arxiv',identifier)] is None:
+                    definitive = False
+                continue
+            validation = func_validate(identifier,'arxiv')
+            checked[('arxiv',identifier)] = validation
+            if validation:
+                return (identifier,'arxiv ID', validation), True
+            if validation is None:
+                definitive = False
+
+    ##Then we look for ISBNs
+    #for v in range(len(isbn_regexp)):
+    #    identifiers = extract_isbn_from_text(text,version=v)
+    #    for identifier in identifiers:
+    #        validation = func_validate(identifier,'isbn')
+    #        if validation:
+    #            return (identifier,'isbn', validation), True
+
+    return (None, None, None), definitive
+
+def find_identifier_in_response(response,func_validate,chunk_size=8192):
+    """
+    Given a response object returned by requests.get(...,stream=True), it looks for a valid identifier in the body of the response
+    while it is being downloaded. The body is read in chunks, and the download is stopped as soon as a valid identifier is found.
+    Each chunk is only analysed up to its last "end character" (i.e. a space, newline, " or <, see the regexps in patterns.py),
+    and the remaining part is analysed together with the next chunk. This makes sure that an identifier is never truncated
+    at the boundary between two chunks.
 
+    Parameters
+    ----------
+    response : requests.Response object, obtained with stream=True
+    func_validate : function
+        See the docstring of the function find_identifier_in_text
+    chunk_size : int, optional
+        Number of bytes read from the response at each iteration
+
+    Returns
+    -------
+    identifier, desc, validation : see the docstring of the function find_identifier_in_text
+    """
+    if not response.encoding:
+        response.encoding = 'utf-8'
+    remainder = ''
+    for chunk in response.iter_content(chunk_size=chunk_size, decode_unicode=True):
+        text = remainder + chunk
+        cut = max(text.rfind(c) for c in (' ','\n','\r','\t','"','<'))
+        text, remainder = text[:cut+1], text[cut+1:]
+        if not text:
+            continue
+        identifier,desc,info = find_identifier_in_text(text,func_validate,memoize=False)
+        if identifier:
+            return identifier,desc,info
+    if remainder:
+        return find_identifier_in_text(remainder,func_validate,memoize=False)
     return None, None, None
 
 
+#The document info and the text extracted from the last pdf file analysed are stored in a dictionary, so that the
+#different methods applied to the same file (see main.py) do not need to parse the file again. The dictionary is emptied as
+#soon as a different file (or a modified version of the same file) is analysed. See the function get_pdf_cache.
+#Each thread has its own dictionary, since different threads might be analysing different files at the same time (see main.py)
+_thread_data = threading.local()
+
+def get_pdf_cache(file):
+    """
+    Given a valid file object, it returns the dictionary where the document info and the text already extracted from 
+    this file are stored. The cache is identified by the path, the size and the last modification time of the file,
+    and it is reset whenever any of these changes.
+
+    Parameters
+    ----------
+    file : file object, opened as 'rb
+    
+    Returns
+    -------
+    cache : dictionary, or None if the file object does not correspond to a locally available file
+    """
+    try:
+        stat = os.stat(file.name)
+    except Exception:
+        return None
+    key = (os.path.abspath(file.name), stat.st_size, stat.st_mtime_ns)
+    pdf_cache = get_thread_pdf_cache()
+    if pdf_cache.get('key') != key:
+        pdf_cache.clear()
+        pdf_cache['key'] = key
+    return pdf_cache
+
+def get_thread_pdf_cache():
+    """
+    Returns the dictionary used by the current thread to store the content extracted from the last pdf file analysed.
+    """
+    if not hasattr(_thread_data,'pdf_cache'):
+        _thread_data.pdf_cache = {}
+    return _thread_data.pdf_cache
+
+def get_pdf_reader(file):
+    """
+    Given a valid file object, it returns a pypdf PdfReader object for it. The same PdfReader is used to extract both the info and the text
+    of the file (see get_pdf_info and get_pdf_text), so that the cross-reference table and the objects of the pdf are parsed only once.
+    The PdfReader is reused only as long as it is bound to the same (open) file object.
+
+    Parameters
+    ----------
+    file : file object, opened as 'rb
+
+    Returns
+    -------
+    pdf : PdfReader
+    """
+    cache = get_pdf_cache(file)
+    if cache is not None:
+        cached_file, pdf = cache.get('pypdf_reader', (None, None))
+        if cached_file is file and not file.closed:
+            return pdf
+    pdf = PdfReader(file,strict=False)
+    if cache is not None:
+        cache['pypdf_reader'] = (file, pdf)
+    return pdf
+
 def get_pdf_info(file):
     """
     Given a valid file object, it returns a dictionary of info. 
-    Currently, it uses PyPDF to extract the info.
+    Currently, it uses pypdf to extract the info. The info are extracted only once per file (see get_pdf_cache),
+    and a new copy of the dictionary is returned at each call.
     
     Parameters
     ----------
@@ -370,28 +768,34 @@ def get_pdf_info(file):
     -------
     info : dictionary
     """
+    cache = get_pdf_cache(file)
+    if cache is None or not 'info' in cache:
+        info = None
+        try:
+            pdf = get_pdf_reader(file)
+            try:
+                info = pdf.metadata
+                if info:
+                    info = {key : info[key] for key in info.keys()}
+            except Exception as e:
+                logger.error(f"An error occurred when retrieving the pdf info with pypdf: {e}")
+        except Exception as e:
+            logger.error("It was not possible to open the file with pypdf. Is this a valid pdf file?")
+            logger.error(f"{e}")
+        if cache is None:
+            return info
+        cache['info'] = info
 
-    try:
-        pdf = PdfFileReader(file,strict=False)
-    except Exception as e:
-        logger.error("It was not possible to open the file with PyPDF2. Is this a valid pdf file?")
-        logger.error(f"{e}")
-        return None
-    try:
-        info = pdf.getDocumentInfo()
-    except Exception as e:
-        logger.error(f"An error occurred when retrieving the pdf info with PyPDF2: {e}")
+    if cache['info'] is None:
         return None
-
-    #file.close()
-    return info
+    return dict(cache['info'])
 
     
 def find_possible_titles(file):
     """
     Given a valid file object, it tries to extract a list of possible titles. 
     In the current implementation it looks for titles by 1) looking for the outcome of pdftitle library, 
-    2) looking in the dictionary returned by the PyPDF library and 3) looking in the filename.
+    2) looking in the dictionary returned by the pypdf library and 3) looking in the filename.
 
     Parameters
     ----------
@@ -402,6 +806,7 @@ def find_possible_titles(file):
     titles : list of strings
         Possible titles of the paper.
     """
+    import pdftitle
     titles = []
     # (1)    
     try:
@@ -428,7 +833,7 @@ def find_possible_titles(file):
         for key, value in info.items():
             if 'title' in key.lower():
                 if isinstance(value,str) and len(value.strip())>12 and len(value.split())>3: #This is to check that the title found is neither empty nor just few characters or few words
-                    logger.info(f"PyPDF2 found the title \"{title}\"")
+                    logger.info(f"pypdf found the title \"{title}\"")
                     titles.append(value.strip())         
     # (4)
     title = os.path.basename(file.name)
@@ -445,7 +850,7 @@ def find_possible_titles(file):
 def get_pdf_text(file,reader):
     """
     Given a valid file object (pointing to a pdf file), it returns the text of the pdf file extracted with the library 
-    specified in the 'reader' input variable.
+    specified in the 'reader' input variable. The text is extracted only once per file and per library (see get_pdf_cache).
 
     Parameters
     ----------
@@ -453,15 +858,120 @@ def get_pdf_text(file,reader):
     reader : string
         It specifies which library is used to extract the text from the pdf.
         The currently supported values are either 
-            'pypdf' (uses the PyPDF2 module)
+            'pymupdf' (uses the PyMuPDF module)
+            'pypdf' (uses the pypdf module)
+            'pdfminer' (uses the pdfminer.six module)
             'textract' (uses the 'textract' module)
     Returns
     -------
     text : list of strings
     """
+    cache = get_pdf_cache(file)
+    if cache is not None:
+        if not ('text',reader) in cache:
+            cache[('text',reader)] = _extract_pdf_text(file,reader)
+        text = cache[('text',reader)]
+        return list(text) if isinstance(text,list) else text
+    return _extract_pdf_text(file,reader)
+
+def iter_pdf_text(file,reader):
+    """
+    Generator version of get_pdf_text. When reader = 'pymupdf' or 'pypdf', the text is extracted and yielded one page at a time, so that 
+    the caller can stop the extraction as soon as it finds what it is looking for (e.g. a DOI in the first page). If all pages 
+    are extracted, the text is stored in the cache of this file (see get_pdf_cache). For any other reader, or if the text was 
+    already extracted, this is equivalent to iterating over the list returned by get_pdf_text.
+
+    Parameters
+    ----------
+    file : file object, opened as 'rb
+    reader : string
+        See get_pdf_text
+    Yields
+    -------
+    text : string
+    """
+    cache = get_pdf_cache(file)
+    if not reader in page_text_iterators or (cache is not None and ('text',reader) in cache):
+        yield from (get_pdf_text(file,reader) or [])
+        return
+    text = []
+    for page_text in page_text_iterators[reader](file):
+        text.append(page_text)
+        yield page_text
+    if cache is not None:
+        cache[('text',reader)] = text
+
+def _iter_pdf_text_pypdf(file):
+    """
+    Yields the text of each page of the pdf file, extracted with pypdf, followed by the content of any text annotation.
+    """
+    try:
+        pdf = get_pdf_reader(file)
+    except Exception as e:
+        logger.error(f"An error occurred when reading the content of this file with pypdf.")
+        logger.error("Error from pypdf: " + str(e))
+        return
+
+    #The page tree is walked only once. The text annotations found along the way are yielded after the text of all pages
+    annotations = []
+    extraction_failed = False
+    try:
+        for page in pdf.pages:
+            if not extraction_failed:
+                try:
+                    yield page.extract_text()
+                except Exception as e:
+                    logger.error("An error occured while loading the document text with pypdf. The pdf version might be not supported.")
+                    logger.error("Error from pypdf: " + str(e))
+                    extraction_failed = True
+            # Checking if there are annotations
+            if "/Annots" in page:
+                for annot in page["/Annots"]:
+                    annot = annot.get_object()
+                    if annot.get("/Subtype") in ["/FreeText", "/Text"] and annot.get("/Contents"):
+                        annotations.append(annot["/Contents"])
+    except Exception as e:
+        logger.error("An error occured while reading the pages of the document with pypdf.")
+        logger.error("Error from pypdf: " + str(e))
+
+    yield from annotations
+
+def _iter_pdf_text_pymupdf(file):
+    """
+    Yields the text of each page of the pdf file, extracted with PyMuPDF.
+    The file is opened by its name, so that PyMuPDF reads from disk only the objects it needs instead of a copy of the whole file in memory.
+    File objects without a name on disk (e.g. io.BytesIO) are read into memory.
+    """
+    try:
+        name = getattr(file, 'name', None)
+        if isinstance(name, str) and os.path.isfile(name):
+            doc = fitz.open(name, filetype='pdf')
+        else:
+            file.seek(0)
+            doc = fitz.open(stream=file.read(), filetype='pdf')
+    except Exception as e:
+        logger.error(f"An error occurred when reading the content of this file with PyMuPDF.")
+        logger.error("Error from PyMuPDF: " + str(e))
+        return
+    with doc:
+        try:
+            for page in doc:
+                yield page.get_text()
+        except Exception as e:
+            logger.error("An error occured while loading the document text with PyMuPDF.")
+            logger.error("Error from PyMuPDF: " + str(e))
+
+#Libraries which can extract the text of a pdf file one page at a time (see iter_pdf_text)
+page_text_iterators = {'pymupdf': _iter_pdf_text_pymupdf, 'pypdf': _iter_pdf_text_pypdf}
+
+def _extract_pdf_text(file,reader):
+    """
+    Extracts the text of the pdf file with the library specified by reader. See get_pdf_text.
+    """
     text =[]
 
     if reader == 'pdfminer':
+        from pdfminer.high_level import extract_text
         try:
             pdf_text = extract_text(file)
         except Exception as e:
@@ -471,35 +981,8 @@ def get_pdf_text(file,reader):
             
         text.append(pdf_text)
 
-    if reader == 'pypdf':
-        try:
-            pdf = PdfFileReader(file,strict=False)
-        except Exception as e:
-            logger.error(f"An error occurred when reading the content of this file with PyPDF2.")
-            logger.error("Error from PyPDF2: " + str(e))
-            return None
-        try:
-            number_of_pages = pdf.getNumPages()
-        except Exception as e:
-            logger.error(f"An error occurred when retrieving the number of pages in the pdf with PyPDF2.")
-            logger.error("Error from PyPDF2: " + str(e))
-            return None
-            
-        for i in range(number_of_pages):
-            try:
-                text.append( (pdf.getPage(i)).extract_text())
-            except Exception as e:
-                logger.error("An error occured while loading the document text with PyPDF2. The pdf version might be not supported.")
-                logger.error("Error from PyPDF2: " + str(e))
-                break 
-
-        # Checking if there are annotations
-        for page in pdf.pages:
-            if "/Annots" in page:
-                for annot in page["/Annots"]:
-                    subtype = annot.get_object()["/Subtype"]
-                    if subtype in ["/FreeText", "/Text"]:
-                        text.append(annot.get_object()["/Contents"])
+    if reader in page_text_iterators:
+        text = list(page_text_iterators[reader](file))
 
     if reader == 'textract':
         import textract
@@ -535,35 +1018,43 @@ def add_metadata(target,key,value):
     list_files = []
     if  os.path.isdir(target): #if target is a folder, we populate the list list_files with all the pdf files contained in this folder
         logger.info(f"Looking for pdf files in the folder {target}...")
-        pdf_files = [f for f in os.listdir(target) if (f.lower()).endswith('.pdf')]
+        pdf_files = [f for f in os.listdir(target) if f.endswith(pdf_extensions)]
         numb_files = len(pdf_files)
         if len(pdf_files) == 0:
             logger.error("No pdf files found in this folder.")
             return None
         logger.info(f"Found {numb_files} pdf files.")
-        if not(target.endswith(config.get('separator'))): #Make sure the path ends with "\" or "/" (according to the OS)
-            target = target + config.get('separator')
-        for f in pdf_files:
-            list_files.append(target + f)
+        list_files = [os.path.join(target, f) for f in pdf_files]
     else:
         list_files = [target]
 
     for f in list_files:
         logger.info(f"Trying to add the tag \'{key}\'-> \'{value}\' into the metadata of the file \'{f}\'...")
+        #The file is read only once, and it is then parsed from memory
         try:
-            file = open(f, 'rb') 
+            with open(f, 'rb') as file:
+                data = file.read()
         except (FileNotFoundError, IOError):
             msg = "File not found."
             logger.error(msg)
             return False, msg
         try:
-            pdf = PdfFileReader(f,strict=False)
+            pdf = PdfReader(io.BytesIO(data),strict=False)
         except:
-            msg = "It was not possible to open the file with PyPDF2. Is this a valid pdf file?"
+            msg = "It was not possible to open the file with pypdf. Is this a valid pdf file?"
             logger.error(msg)
             return False, msg
         try:
-            writer = PdfWriter(clone_from=f)
+            if pdf.metadata and key in pdf.metadata and pdf.metadata[key] == value:
+                logger.info(f"The tag \'{key}\'-> \'{value}\' is already present in the metadata of the file \'{f}\'.")
+                continue
+        except Exception:
+            pass
+        #The new file is first written into a temporary file, which then replaces the original one. In this way the original
+        #file is never left half-written if an error occurs
+        path_temp = f + '.pdf2doi.tmp'
+        try:
+            writer = PdfWriter(clone_from=pdf)
 
             try:
                 writer.add_metadata({
@@ -573,13 +1064,17 @@ def add_metadata(target,key,value):
                 logger.error("Error from pypdf when adding metadata: " + str(e))
                 pass    
 
-            with open(f, "wb") as fp:
+            with open(path_temp, "wb") as fp:
                 writer.write(fp)
+            os.replace(path_temp, f)
+            get_thread_pdf_cache().clear()
             
             logger.info(f"The tag \'{key}\'-> \'{value}\' was added succesfully to the metadata of the file \'{f}\'...")
             
         except Exception as e:
-            logger.error("Error from PyPDF2: " + str(e))
+            if os.path.exists(path_temp):
+                os.remove(path_temp)
+            logger.error("Error from pypdf: " + str(e))
             msg = f"An error occured while trying to write the tag \'{key}\'-> \'{value}\'  into the metadata of the file \'{f}\'. Maybe the file is open elsewhere?"
             logger.error(msg)
             return False, msg
@@ -772,20 +1267,33 @@ def find_identifier_in_pdf_text(file, func_validate):
     -------
     result : dictionary with identifier and other info (see above)
     """
+    #Maximum number of characters extracted by any of the libraries used so far
+    max_characters_extracted = 0
+
+    def count_characters(texts):
+        nonlocal characters_extracted
+        for text in texts:
+            if isinstance(text,str):
+                characters_extracted += len(text)
+            yield text
+
     for reader in reader_libraries:
-        logger.info(f"Extracting text with the library {reader}...")
-        texts = get_pdf_text(file,reader.lower())
-        
-        if not isinstance(texts,list):
-            texts = [texts]
-        if texts:
-            logger.info(f"Text extracted succesfully. Looking for an identifier in the text...")
-            identifier,desc,info = find_identifier_in_text(texts,func_validate)
-            if identifier: 
-                logger.info(f"A valid {desc} was found in the document text.")
-                return identifier,desc,info
-            else:
-                logger.info(f"Could not find a valid identifier in the document text extracted by {reader}.")
+        #textract is much slower than the other libraries. If the other libraries already extracted a meaningful amount
+        #of text from this file (i.e. this is not a scanned document), it is very unlikely that textract will find anything else
+        if reader.lower() == 'textract' and max_characters_extracted >= config.get('min_characters_to_skip_textract'):
+            logger.info(f"The other libraries extracted {max_characters_extracted} characters from this file. The library {reader} will not be used.")
+            continue
+        logger.info(f"Extracting text with the library {reader} and looking for an identifier in the text...")
+        #The text is analysed while it is being extracted, and the extraction stops as soon as a valid identifier is found
+        characters_extracted = 0
+        texts = count_characters(iter_pdf_text(file,reader.lower()))
+        identifier,desc,info = find_identifier_in_text(texts,func_validate)
+        max_characters_extracted = max(max_characters_extracted, characters_extracted)
+        if identifier: 
+            logger.info(f"A valid {desc} was found in the document text.")
+            return identifier,desc,info
+        else:
+            logger.info(f"Could not find a valid identifier in the document text extracted by {reader}.")
     logger.info("Could not find a valid identifier in the document text.")
     return None, None, None
 
@@ -805,6 +1313,14 @@ def find_identifier_by_googling_title(file, func_validate):
         else:
             logger.info(f"Found {len(titles)} possible title(s).")
             titles.sort(key=len, reverse=True)
+            #We first look for the titles in the Crossref database, which requires a single query per title.
+            #Google searches are done only if this fails
+            for index_title, title in enumerate(titles):
+                logger.info(f"Trying possible title #{index_title+1} '{title}'")
+                identifier,desc,info = find_identifier_in_crossref_search(title,func_validate)
+                if identifier:
+                    logger.info(f"A valid {desc} was found with this Crossref query.")
+                    return identifier, desc, info
             for index_title, title in enumerate(titles):
                 logger.info(f"Trying possible title #{index_title+1} '{title}'")
                 identifier,desc,info = find_identifier_in_google_search(title,func_validate,numb_results=config.get('numb_results_google_search'))
@@ -837,19 +1353,24 @@ def find_identifier_by_googling_first_N_characters_in_pdf(file, func_validate, n
             logger.error(f"The library {reader} could not extract any text from this file.")
             continue
         if isinstance(text,list):
-            text = "".join(text)
+            #Only the first pages which are needed to reach numb_characters characters are joined together
+            length = 0
+            for number_pages, page in enumerate(text, start=1):
+                length += len(page)
+                if length >= numb_characters:
+                    break
+            text = "".join(text[0:number_pages])
         if not(isinstance(text, str)):
             logger.error(f"The library {reader} could not extract any text from this file.")
             continue 
-        text = re.sub(r'[^\x00-\x7f]',r' ',text)    #Remove all non-text characters from the string text
-        for r in ("\n","\r","\t"):
-            text = text.replace(r," ")
-         
+        #Select the first numb_characters characters. This is done before cleaning the text, since the cleaning
+        #replaces each character by exactly one character
+        text = text[0:numb_characters]
+        text = text.translate(non_text_characters_table)    #Replace all non-text characters, newlines and tabs with spaces
+
         if text=="":                                #Check tha the string is still not empty after removing non-text characters
             logger.error(f"The library {reader} could not extract any meaningful text from this file.")
             continue
-            
-        text = text[0:numb_characters]              #Select the first numb_characters characters
 
         logger.info(f"Doing a google search, looking at the first {config.get('numb_results_google_search')} results...")
         identifier,desc,info = find_identifier_in_google_search(text,func_validate,numb_results)
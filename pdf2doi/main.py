@@ -1,19 +1,30 @@
-import argparse
 import logging
-from os import path, listdir
-import pdf2doi.finders as finders
+import os
+import sys
+from os import path, scandir, linesep
 import pdf2doi.config as config
+import pdf2doi.results_cache as results_cache
+from pdf2doi.patterns import pdf_extensions
 import io
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
+logger = logging.getLogger("pdf2doi")
 
 # import easygui Modules that are commented here are imported later only when needed, to improve start up time
 # import pyperclip
+# import argparse
+# import pdf2doi.finders as finders   The module finders imports several heavy libraries (pypdf, pdfminer, requests,...) which are not
+#                                     needed when pdf2doi is called from command line only to show the help or to edit the registry
+
+# Format of each row of the table of identifiers printed by main() and saved by save_identifiers (type of identifier, identifier, path)
+format_identifier_row = '{:<15s} {:<40s} {:<10s}'.format
 
 def pdf2doi(target):
     ''' This is the main routine of the library. When the library is used as a command-line tool (via the entry-point "pdf2doi") the input arguments
     are collected, validated and sent to this function (see the function main() below).
     The function tries to extract the DOI (or other identifiers) of the publication in the pdf files whose path is specified in the input variable target.
-    If target contains the valid path of a folder, the function tries to extract the DOI/identifer of all pdf files in the folder.
+    If target contains the valid path of a folder, the function tries to extract the DOI/identifer of all pdf files in the folder
+    (and in its subfolders, if config.get('recursive') = True).
     It returns a dictionary (or a list of dictionaries) containing info(s) about the file(s) examined, or None if an error occurred.
 
     Example:
@@ -44,8 +55,6 @@ def pdf2doi(target):
 
     '''
 
-    logger = logging.getLogger("pdf2doi")
-
     # Make sure the path is a string in case a Pathlib object is provided
     target = str(target)
     
@@ -55,11 +64,15 @@ def pdf2doi(target):
         return None
 
     # Check if target is a directory
-    # If yes, we look for all the .pdf files inside it, and for each of them
-    # we call again this function
+    # If yes, we look for all the .pdf files inside it, and we analyse each of them
     if path.isdir(target):
         logger.info(f"Looking for pdf files in the folder {target}...")
-        pdf_files = [f for f in listdir(target) if (f.lower()).endswith('.pdf')]
+        pdf_entries = __find_pdf_entries(target, config.get('recursive'))
+        # On hard disks, reading the files in the order of their inode numbers (which roughly follows their position
+        # on the disk) reduces the seek times. This is not useful on SSDs, hence it is done only when requested
+        if config.get('sort_files_by_inode'):
+            pdf_entries.sort(key=lambda entry: entry.inode())
+        pdf_files = [entry.path for entry in pdf_entries]
         numb_files = len(pdf_files)
 
         if numb_files == 0:
@@ -67,18 +80,41 @@ def pdf2doi(target):
             return None
 
         logger.info(f"Found {numb_files} pdf files.")
-        if not (
-        target.endswith(config.get('separator'))):  # Make sure the path ends with "\" or "/" (according to the OS)
-            target = target + config.get('separator')
-
-        identifiers_found = []  # For each pdf file in the target folder we will store a dictionary inside this list
-        for f in pdf_files:
-            logger.info("................")
-            file = target + f
-            # For each file we call again this function, but now the input argument target is set to the path of the file
-            result = pdf2doi(target=file)
-            logger.info(result['identifier'])
-            identifiers_found.append(result)
+
+        # The files are processed concurrently by a pool of config.get('workers') threads. Most of the time spent on each
+        # file is spent waiting for the answers of web servers (google, dx.doi.org, arxiv.org, ...), hence several files
+        # can be analysed at the same time. The results are returned in the same order as the files in pdf_files.
+        # The pool of HTTP connections used by finders is enlarged accordingly, so that each thread can keep its connections alive
+        # If config.get('use_processes') = True, a pool of processes is used instead, so that also the extraction of the text
+        # (which is CPU-bound) runs in parallel. Each process starts with a copy of the current settings.
+        workers = max(1, config.get('workers'))
+        if config.get('use_processes') and workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=__init_worker_process, initargs=(config.get_params(),))
+        else:
+            import pdf2doi.finders as finders
+            finders.set_http_pool_size(workers)
+            executor = ThreadPoolExecutor(max_workers=workers)
+        with executor:
+            # Files with the same content (e.g. the same paper saved twice with different names) are analysed only once.
+            # Only the first file of each group of identical files is analysed (see __group_identical_files)
+            groups, signatures = __group_identical_files(pdf_entries, executor)
+            files_to_analyse = [group[0] for group in groups]
+
+            # Each task also asks the OS to start reading the next file, so that it is already in memory when its turn comes
+            next_files = files_to_analyse[1:] + [None]
+            results = {}
+            for group, result in zip(groups, executor.map(__process_file, files_to_analyse, next_files,
+                                                         [signatures.get(filename) for filename in files_to_analyse])):
+                results[group[0]] = result
+                for duplicate in group[1:]:
+                    logger.info("The file %s has the same content as %s, the same result is used.", duplicate, group[0])
+                    try:
+                        results[duplicate] = __save_result(duplicate, dict(result, path=duplicate), signatures.get(duplicate))
+                    except Exception:
+                        logger.exception(f"Error while processing the file {duplicate}")
+                        results[duplicate] = {'identifier': None, 'path': duplicate}
+                logger.info("Processed %d/%d files.", len(results), numb_files)
+        identifiers_found = [results[filename] for filename in pdf_files] # For each pdf file in the target folder we store a dictionary inside this list
 
         logger.info("................")
 
@@ -87,22 +123,139 @@ def pdf2doi(target):
     # If target is not a directory, we check that it is an existing file and that it ends with .pdf
     else:
         filename = target
-        logger.info(f"Trying to retrieve a DOI/identifier for the file: {filename}")
-        if not path.exists(filename):
-            logger.error(f"'{filename}' is not a valid file.")
-            return None
-        if not (filename.lower()).endswith('.pdf'):
+        if not filename.endswith(pdf_extensions):
             logger.error("The file must have .pdf extension.")
             return None
+        return __process_file(filename) # This will be a dictionary with all entries as None
+
+
+def __find_pdf_entries(folder, recursive=False):
+    ''' Returns a list with the os.DirEntry objects of all the pdf files contained in folder. If recursive = True, the pdf files contained
+    in all its subfolders are also included, after the ones contained in folder itself. Symbolic links to folders are not followed.
+    '''
+    # scandir returns the type of each entry together with its name, so that folders and other non-regular files
+    # can be discarded without additional system calls
+    with scandir(folder) as entries:
+        entries = list(entries)
+    pdf_entries = [entry for entry in entries if entry.name.endswith(pdf_extensions) and entry.is_file()]
+    if recursive:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                try:
+                    pdf_entries.extend(__find_pdf_entries(entry.path, recursive))
+                except OSError as e:
+                    logger.error(f"It was not possible to look for pdf files in the folder {entry.path}: {e}")
+    return pdf_entries
+
+def __group_identical_files(pdf_entries, executor):
+    ''' Groups the pdf files described by the os.DirEntry objects in pdf_entries according to their content. It returns a list of groups 
+    (each group being a list of paths, in the same order as pdf_entries) and a dictionary which contains the signatures 
+    (see results_cache.get_file_signature) computed for some of the files, indexed by their paths.
+    Files with different sizes cannot have the same content, hence only the files whose size is equal to the one of another file 
+    are read (by the threads or processes of executor) to compute their signatures.
+    '''
+    files_by_size = {}
+    for entry in pdf_entries:
+        try:
+            size = entry.stat().st_size
+        except OSError:
+            size = entry.path # A file which cannot be accessed is kept in a group on its own
+        files_by_size.setdefault(size, []).append(entry.path)
+    files_to_hash = [filename for files in files_by_size.values() if len(files) > 1 for filename in files]
+    signatures = dict(zip(files_to_hash, executor.map(results_cache.get_file_signature, files_to_hash)))
+    groups = {}
+    for entry in pdf_entries:
+        digest = signatures.get(entry.path, (None, None))[0]
+        groups.setdefault(digest or entry.path, []).append(entry.path)
+    return list(groups.values()), signatures
+
+def __init_worker_process(params):
+    """
+    Initializes each process of the pool used by pdf2doi() when config.get('use_processes') = True, by copying the settings of the parent process.
+    """
+    config.update_params(params)
+    config.set('verbose', params['verbose'])
+
+
+def __process_file(filename, next_filename=None, signature=None):
+    """
+    Try to find an identifier of the pdf file specified by the input argument filename, and (if config.get('save_identifier_metadata') = True)
+    store the identifier found in the metadata of the file. This function does not check wheter filename is a valid path to a pdf file.
+    It can be called by different threads at the same time, as long as they analyse different files.
+
+    Parameters
+    ----------
+    filename : string
+        Absolute or relative path of a single .pdf file
+    next_filename : string, optional
+        Path of the file that will be analysed next (if any). The OS is asked to start reading it in the background,
+        while this file is being analysed.
+    signature : tuple, optional
+        Signature of the file (see results_cache.get_file_signature), if it was already computed. Otherwise it is computed here,
+        only if the cache is enabled.
+
+    Returns
+    -------
+    result, dictionary
+        A dictionary with the same keys as the one returned by pdf2doi_singlefile
+    """
+
+    if next_filename:
+        __prefetch_file(next_filename)
+    logger.info("................")
+    logger.info("Trying to retrieve a DOI/identifier for the file: %s", filename)
+    # If this file was already analysed (and it has not been modified since then), the result is read from the cache
+    if signature is None and config.get('use_cache'):
+        signature = results_cache.get_file_signature(filename)
+    result = results_cache.get(filename, signature)
+    if result:
+        logger.info(f"The {result['identifier_type']} {result['identifier']} was found for this file in a previous run of pdf2doi (see the setting 'use_cache').")
+        logger.info(result['identifier'])
+        return result
+    try:
         result = pdf2doi_singlefile(filename)
         if result['identifier'] == None:
             logger.error("It was not possible to find a valid identifier for this file.")
+        result = __save_result(filename, result, signature)
+    except Exception:
+        logger.exception(f"Error while processing the file {filename}")
+        result = {'identifier': None}
+    result.setdefault('path', filename)
+    logger.info(result['identifier'])
+    return result
 
-        if (config.get('save_identifier_metadata')) == True:
-            if result['identifier'] and not (result['method'] == "document_infos"):
-                finders.add_found_identifier_to_metadata(filename, result['identifier'])
 
-        return result  # This will be a dictionary with all entries as None
+def __save_result(filename, result, signature=None):
+    """
+    Adds the identifier found for the file specified by filename to its metadata (if config.get('save_identifier_metadata') = True)
+    and stores the result in the cache (see results_cache.py). It returns the input dictionary result.
+    signature is the signature of the file before any modification (see results_cache.get_file_signature), or None if it is not known.
+    """
+    if (config.get('save_identifier_metadata')) == True:
+        if result['identifier'] and not (result['method'] == "document_infos"):
+            import pdf2doi.finders as finders
+            finders.add_found_identifier_to_metadata(filename, result['identifier'])
+            signature = None # The file was modified, hence its signature must be computed again
+    # The result is stored only now, since adding the identifier to the metadata modifies the file
+    results_cache.store(filename, result, signature)
+    return result
+
+
+def __prefetch_file(filename):
+    """
+    Asks the OS to load the content of the file specified by filename in the page cache, without waiting for it.
+    This is only possible on systems which support posix_fadvise, otherwise nothing is done.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(filename, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
 
 
 def pdf2doi_singlefile(file):
@@ -128,8 +281,6 @@ def pdf2doi_singlefile(file):
 
     """
 
-    logger = logging.getLogger("pdf2doi")
-
     result = {'identifier': None}
 
     try:
@@ -146,53 +297,65 @@ def pdf2doi_singlefile(file):
     return result
 
 
-def __find_doi(file: io.IOBase) -> dict:
-    logger = logging.getLogger("pdf2doi")
-
-    # Several methods are now applied to find a valid identifier in the .pdf file identified by filename
-
-    # First method: we look into the pdf metadata (in the current implementation this is done
-    # via the getDocumentInfo() method of the library PyPdf) and see if any of them is a string which containts a
-    # valid identifier inside it. We first look for the elements of the dictionary with keys '/doi' or /pdf2doi_identifier'(if the they exist),
-    # and then any other field of the dictionary
-    logger.info(f"Method #1: Looking for a valid identifier in the document infos...")
-    result = finders.find_identifier(file, method="document_infos", keysToCheckFirst=['/doi', '/pdf2doi_identifier'])
-    if result['identifier']:
-        return result
-
-    # Second method: We look for a DOI or arxiv ID inside the filename
-    logger.info(f"Method #2: Looking for a valid identifier in the file name...")
-    result = finders.find_identifier(file, method="filename")
-    if result['identifier']:
-        return result
-
-    # Third method: We look in the plain text of the pdf and try to find something that matches a valid identifier.
-    logger.info(f"Method #3: Looking for a valid identifier in the document text...")
-    result = finders.find_identifier(file, method="document_text")
-    if result['identifier']:
-        return result
+# The methods applied (in this order) by __find_doi to find a valid identifier in a .pdf file. Each element of the tuple
+# contains the name of the method (i.e. a key of the dictionary finders.finder_methods), the additional keyword arguments
+# passed to finders.find_identifier, whether the method requires web searches, and the message logged before applying the method.
+#
+# First method: we look into the pdf metadata (in the current implementation this is done
+# via the metadata property of the library pypdf) and see if any of them is a string which containts a
+# valid identifier inside it. We first look for the elements of the dictionary with keys '/doi', '/DOI' or /pdf2doi_identifier'(if the they exist),
+# and then any other field of the dictionary
+# Second method: We look for a DOI or arxiv ID inside the filename
+# Third method: We look in the plain text of the pdf and try to find something that matches a valid identifier.
+# Fourth method: We look for possible titles of the paper, do a google search with them,
+# open the first results and look for identifiers in the plain text of the searcg results.
+# Fifth method: We extract the first N characters from the file (where N is set by config.get('N_characters_in_pdf')) and we use it as
+# a query for a google seaerch. We open the first results and look for identifiers in the plain text of the searcg results.
+finder_methods_sequence = (
+    ("document_infos", {'keysToCheckFirst': ['/doi', '/DOI', '/pdf2doi_identifier']}, False,
+     "Method #1: Looking for a valid identifier in the document infos..."),
+    ("filename", {}, False,
+     "Method #2: Looking for a valid identifier in the file name..."),
+    ("document_text", {}, False,
+     "Method #3: Looking for a valid identifier in the document text..."),
+    ("title_google", {}, True,
+     "Method #4: Looking for possible publication titles..."),
+    ("first_N_characters_google", {}, True,
+     "Method #5: Trying to do a google search with the first {N_characters_in_pdf} characters of this pdf file..."),
+)
 
-    # Fourth method: We look for possible titles of the paper, do a google search with them,
-    # open the first results and look for identifiers in the plain text of the searcg results.
-    logger.info(f"Method #4: Looking for possible publication titles...")
-    result = finders.find_identifier(file, method="title_google")
-    if result['identifier']:
-        return result
 
-    # Fifth method: We extract the first N characters from the file (where N is set by config.get('N_characters_in_pdf')) and we use it as
-    # a query for a google seaerch. We open the first results and look for identifiers in the plain text of the searcg results.
-    logger.info(
-        f"Method #5: Trying to do a google search with the first {config.get('N_characters_in_pdf')} characters of this pdf file...")
-    result = finders.find_identifier(file, method="first_N_characters_google")
-    if result['identifier']:
-        return result
+def __find_doi(file: io.IOBase) -> dict:
+    import pdf2doi.finders as finders
+    # The methods listed in finder_methods_sequence are applied one after the other, until a valid identifier is found.
+    # When web searches are disabled, the methods which require them are skipped altogether (instead of, e.g., looking
+    # for the possible titles of the paper without then being able to search them)
+    websearch = config.get('websearch')
+    for method, kwargs, requires_websearch, message in finder_methods_sequence:
+        if requires_websearch and not websearch:
+            logger.info("NOTE: The method '%s' requires web searches, which are currently disabled by the user.", method)
+            continue
+        if logger.isEnabledFor(logging.INFO): # The message is built only if it is going to be shown
+            logger.info(message.format(N_characters_in_pdf=config.get('N_characters_in_pdf')))
+        result = finders.find_identifier(file, method=method, **kwargs)
+        if result['identifier']:
+            return result
 
     #If execution arrived to this point, it means that no identifier was found. We still return the dictionary returned by the last attempt, for further processing
     #In this case result['identifier']=None
     return result 
 
 
-def save_identifiers(filename_identifiers, results, clipboard=False):
+def format_results(results):
+    """
+    Returns the rows of the table of identifiers (type of identifier, identifier, path) printed by main() and saved by save_identifiers,
+    one row for each element of the input list results. The rows do not end with a newline.
+    """
+    return [format_identifier_row(result['identifier_type'], result['identifier'], result['path']) if result.get('identifier')
+            else format_identifier_row('n.a.', 'n.a.', result['path']) for result in results]
+
+
+def save_identifiers(filename_identifiers, results, clipboard=False, rows=None, folder=None):
     ''' Write all identifiers contained in the input list 'results' into a text file with a path specified by filename_identifiers (if filename_identifiers is a
         valid string) and/or into the clipboard (if clipboard = True).
 
@@ -204,26 +367,28 @@ def save_identifiers(filename_identifiers, results, clipboard=False):
         Each element of the list 'results' describes a .pdf file, and contains the pdf identifier and other infos.
     clipboard : boolean, optional
         If set to True, the identifiers are stored in the clipboard. Default is False.
+    rows : list of strings, optional
+        The rows returned by format_results(results), if they were already computed. Default is None.
+    folder : string, optional
+        Folder where the file filename_identifiers is created (typically the folder targeted by pdf2doi). If None (default), the folder
+        containing the first file described in results is used.
 
     Returns
     -------
     None.
     '''
-    logger = logging.getLogger("pdf2doi")
-
     # If a string was passed via the args.filename_identifiers, we create the full path of the file where identifiers will be saved
     if isinstance(filename_identifiers, str):
-        path_filename_identifiers = path.dirname(results[0]['path']) + config.get('separator') + filename_identifiers
+        if folder is None:
+            folder = path.dirname(results[0]['path'])
+        path_filename_identifiers = path.join(folder, filename_identifiers)
         try:
-            text = ''
-            for result in results:
-                if result['validation_info']:
-                    text = text + '{:<15s} {:<40s} {:<10s}\n'.format(result['identifier_type'], result['identifier'],
-                                                                     result['path'])
-                else:
-                    text = text + '{:<15s} {:<40s} {:<10s}\n'.format('n.a.', 'n.a.', result['path'])
-            with open(path_filename_identifiers, "w", encoding="utf-8") as text_file:
-                text_file.write(text)
+            # The whole text is encoded once and written in binary mode with a single call. The lines end with os.linesep,
+            # as they would if the file was written in text mode
+            if rows is None:
+                rows = format_results(results)
+            with open(path_filename_identifiers, "wb") as text_file:
+                text_file.write(''.join(row + linesep for row in rows).encode('utf-8'))
             logger.info(f'All found identifiers were saved in the file {filename_identifiers}')
         except Exception as e:
             logger.error(e)
@@ -233,10 +398,7 @@ def save_identifiers(filename_identifiers, results, clipboard=False):
     if clipboard:
         import pyperclip
         try:
-            text = ''
-            for result in results:
-                if result['validation_info']:
-                    text = text + result['identifier'] + '\n'
+            text = ''.join(result['identifier'] + '\n' for result in results if result.get('validation_info'))
             pyperclip.copy(text)
             logger.info(f'All found identifiers have been stored in the system clipboard')
         except Exception as e:
@@ -245,6 +407,7 @@ def save_identifiers(filename_identifiers, results, clipboard=False):
 
 
 def main():
+    import argparse
     parser = argparse.ArgumentParser(
         description="Retrieves the DOI or other identifiers (e.g. arXiv) from pdf files of a publications.",
         epilog="")
@@ -286,6 +449,27 @@ def main():
     parser.add_argument('-google',
                         help=f"Set how many results should be considered when doing a google search for the DOI (default={str(config.get('numb_results_google_search'))}).",
                         action="store", dest="google_results", type=int)
+    parser.add_argument("-j",
+                        "--jobs",
+                        help=f"Set how many pdf files should be analysed at the same time when a folder is targeted (default={str(config.get('workers'))}).",
+                        action="store", dest="jobs", type=int)
+    parser.add_argument("-processes",
+                        help="When a folder is targeted and JOBS is larger than 1, analyse the pdf files with a pool of processes instead of threads. This is faster when most of the time is spent extracting the text of the files.",
+                        action="store_true")
+    parser.add_argument("-cache",
+                        "--use_cache",
+                        help="Store the identifiers found in a cache on disk, so that they are not searched again if pdf2doi is later called on the same (unmodified) files. By default, the cache is neither read nor updated.",
+                        action="store_true")
+    parser.add_argument("-clear_cache",
+                        help="Remove all the identifiers stored in the cache by previous runs. If no path is specified, nothing else is done.",
+                        action="store_true")
+    parser.add_argument("-r",
+                        "--recursive",
+                        help="When a folder is targeted, also analyse the pdf files contained in all its subfolders.",
+                        action="store_true")
+    parser.add_argument("-sort_inode",
+                        help="When a folder is targeted, analyse the pdf files in the order of their inode numbers, which reduces the seek times on hard disks (not useful on SSDs).",
+                        action="store_true")
     parser.add_argument("-s",
                         "--save_identifiers_file",
                         dest="filename_identifiers",
@@ -322,6 +506,11 @@ def main():
         import pdf2doi.utils_registry as utils_registry
         utils_registry.uninstall_right_click()
         return
+    if args.clear_cache:
+        results_cache.clear()
+        print("The cache of the identifiers found in previous runs has been cleared.")
+        if not args.path:
+            return
     if isinstance(args.path, list):
         if len(args.path) > 0:
             target = args.path[0]
@@ -349,6 +538,7 @@ def main():
     # Nothing else will be done
     if args.identifier or args.identifier == "":
         if isinstance(args.identifier, str):
+            import pdf2doi.finders as finders
             result = finders.add_found_identifier_to_metadata(target, args.identifier)
             if args.id_input_box and len(result) > 1:
                 if result[0] == False:
@@ -362,21 +552,30 @@ def main():
 
     if args.google_results:
         config.set('numb_results_google_search', args.google_results)
+    if args.jobs:
+        config.set('workers', args.jobs)
+    if args.processes:
+        config.set('use_processes', True)
+    config.set('use_cache', args.use_cache)
+    if args.recursive:
+        config.set('recursive', True)
+    if args.sort_inode:
+        config.set('sort_files_by_inode', True)
     results = pdf2doi(target=target)
 
     if not results:
         return
     if not isinstance(results, list):
         results = [results]
-    for result in results:
-        if result['identifier']:
-            print('{:<15s} {:<40s} {:<10s}\n'.format(result['identifier_type'], result['identifier'], result['path']))
-        else:
-            print('{:<15s} {:<40s} {:<10s}\n'.format('n.a.', 'n.a.', result['path']))
+    # The table of identifiers is printed with a single write. Each row is followed by an empty line
+    rows = format_results(results)
+    sys.stdout.write(''.join(row + '\n\n' for row in rows))
 
-            # Call the function save_identifiers. If args.filename_identifiers is a valid string, it will save all found identifiers in a text file with that name.
+    # Call the function save_identifiers. If args.filename_identifiers is a valid string, it will save all found identifiers in a text file with that name.
     # If args.save_doi_clipboard is true, it will copy all identifiers into the clipboard. Otherwise, it will do nothing
-    save_identifiers(args.filename_identifiers, results, args.save_doi_clipboard)
+    # The file is created in the targeted folder (or in the folder of the targeted file), also when the pdf files were found in its subfolders
+    folder = target if path.isdir(target) else path.dirname(target)
+    save_identifiers(args.filename_identifiers, results, args.save_doi_clipboard, rows=rows, folder=folder)
 
     return
 
@@ -1,6 +1,9 @@
 # This regex for the DOI is taken from https://www.crossref.org/blog/dois-and-matching-regular-expressions/
 # but allows multiple separator types, a prefix, and assumes the DOI is lowercase.
 import re
+import sys
+import itertools
+import functools
 
 # Based on local DOI corpus:
 # 0% have non-standard separators (e.g. 10.1177:0146167297234003)
@@ -23,31 +26,59 @@ DOI = r"""(?xm)
   (?P<trailing> ([\s\n\"<.]|$))
 """
 
+DOI_compiled = re.compile(DOI)
+
+# Most of the strings passed to standardise_doi are bare DOIs (e.g. the DOIs extracted by doi_regexp, or stored in the metadata). When the whole
+# string is a bare DOI, the verbose regexp DOI above matches it entirely, and its registrant and suffix are found much faster by this regexp.
+BARE_DOI_compiled = re.compile(r"10\.(\d{2,9})[:\-\/\s\]]([\-._;()\/:a-z0-9]+[a-z0-9])")
+
+# The same candidate DOI is standardised several times (e.g. once when it is extracted from a text and once when it is validated by
+# finders.validate), hence the results are memoized
+@functools.lru_cache(maxsize=1024)
 def standardise_doi(identifier):
     """
     Standardise a DOI by removing any marker, lowercase, and applying a consistent separator
     """
-    doi_meta = dict()
-    for match in re.finditer(DOI, identifier.lower()):
-        doi_meta.update(match.groupdict())
-    
-    if any(key not in doi_meta for key in ["registrant", "suffix"]):
+    identifier = identifier.lower()
+    match = BARE_DOI_compiled.fullmatch(identifier)
+    if match:
+        return f"10.{match.group(1)}/{match.group(2)}"
+
+    # Only the last match is used (registrant and suffix are never empty in a match)
+    for match in DOI_compiled.finditer(identifier):
+        pass
+    if match is None:
         return None
     
-    return f"10.{doi_meta['registrant']}/{doi_meta['suffix']}"
+    return f"10.{match['registrant']}/{match['suffix']}"
+
 
+# All the possible capitalizations of the extension '.pdf' (i.e. '.pdf', '.pdF', ..., '.PDF'). Checking if a file name ends with any of them
+# (str.endswith accepts a tuple) avoids creating a lowercase copy of each file name.
+pdf_extensions = tuple('.' + ''.join(chars) for chars in itertools.product('pP', 'dD', 'fF'))
 
 # This is a regex for arxiv identifiers (in use after 2007) and it is used to validate a given arxiv ID.
 arxiv2007_pattern = r'^(\d{4}\.\d+)(?:v\d+)?$'
                                                                             
 
+# Possessive quantifiers are supported by the re module starting from python 3.11. A possessive quantifier never gives back 
+# the characters it matched. In the version 2 of doi_regexp (see below) the last character class and the following terminating
+# characters are disjoint, so making the last quantifier possessive does not change the matches, but it reduces the backtracking 
+# by a constant factor. The two character classes of version 2 overlap (both contain dots, colons and dashes), hence the first one is 
+# also limited to max_length_doi_run characters: on long sequences of dots, colons and dashes (which are common in the text of pdf files) 
+# the regex only tries a bounded number of ways to split the sequence, and its running time is linear instead of quadratic.
+# Identifiers longer than 256 characters are anyway discarded by the function validate (see max_length_identifier in finders.py).
+POSSESSIVE_PLUS = '++' if sys.version_info >= (3, 11) else '+'
+max_length_doi_run = 256
+
 # The list doi_regexp contains several regular expressions used to identify a DOI in a string. They are (roughly) ordered from stricter to less and less strict.
 doi_regexp = [r'doi[\s\.\:]{0,2}(10\.\d{4}[\d\:\.\-\/a-z]+)(?:[\s\n\"<]|$)', # version 0 looks for something like "DOI : 10.xxxxS[end characters] where xxxx=4 digits, S=combination of characters, digits, ., :, -, and / of any length
                                                                             # [end characters] is either a space, newline, " , < or the end of the string. The initial part could be either "DOI : ", "DOI", "DOI:", "DOI.:", ""DOI:." 
                                                                             # and with possible spaces or lower cases.
               r'(10\.\d{4}[\d\:\.\-\/a-z]+)(?:[\s\n\"<]|$)',                 # in version 1 the requirement of having "DOI : " in the beginning is removed
-              r'(10\.\d{4}[\:\.\-\/a-z]+[\:\.\-\d]+)(?:[\s\na-z\"<]|$)',     # version 2 is useful for cases in which, in plain texts, the DOI is not followed by a space, newline or special characters,
+              r'(10\.\d{4}[\:\.\-\/a-z]{1,' + str(max_length_doi_run) + r'}[\:\.\-\d]' + POSSESSIVE_PLUS + r')(?:[\s\na-z\"<]|$)',     # version 2 is useful for cases in which, in plain texts, the DOI is not followed by a space, newline or special characters,
                                                                             #but is instead followed by other letters. In this case we can still isolate the DOI if we assume that the DOI always ends with numbers
+                                                                            #The first character class is bounded and the last quantifier is possessive (when supported), see the definition of POSSESSIVE_PLUS above.
               r'https?://[ -~]*doi[ -~]*/(10\.\d{4,9}/[-._;()/:a-z0-9]+)(?:[\s\n\"<]|$)', # version 3 is useful when the DOI can be found in a google result as an URL of the form https://doi.org/[DOI]
                                                                             #The regex for [DOI] is 10\.\d{4,9}/[-._;()/:a-z0-9]+ (taken from here https://www.crossref.org/blog/dois-and-matching-regular-expressions/)
                                                                             #and it must be followed by a valid ending character: either a speace, a new line, a ", a <, or end of string.
@@ -70,6 +101,21 @@ arxiv_regexp = [r'arxiv[\s]*\:[\s]*(\d{4}\.\d+)(?:v\d+)?(?:[\s\n\"<]|$)',  #vers
                                                                             #but requires that the string contains ONLY the arXiv ID.
 
 
+#Compiled versions of the regular expressions defined above, to be used in the hot loops which look for identifiers in the text of pdf files.
+#They are compiled without the flag re.IGNORECASE, hence they must be applied to lowercase strings: lowering each text once is much cheaper 
+#than letting the regex engine fold the case of each character in each scan. The lists of strings doi_regexp and arxiv_regexp are kept since 
+#they are also used to build other matchers (see finders.py)
+doi_regexp_compiled = tuple(re.compile(regexp) for regexp in doi_regexp)
+arxiv_regexp_compiled = tuple(re.compile(regexp) for regexp in arxiv_regexp)
+
+#Literal substring contained in any match of any version of doi_regexp. Checking if a (lowercase) text contains it is the fastest way to 
+#discard the texts which cannot contain any DOI
+doi_required_substring = '10.'
+#Similarly, any match of any version of arxiv_regexp contains four digits followed by a dot and a digit. This regexp starts with a digit class 
+#instead of a literal, but it is still much faster than applying all the versions of arxiv_regexp
+arxiv_required_regexp = re.compile(r'\d{4}\.\d')
+
+
 ##Following regexp is taken from https://www.oreilly.com/library/view/regular-expressions-cookbook/9781449327453/ch04s13.html
 #isbn_regexp = [''.join(['(?:ISBN(?:-1[03])?:? )?(?=[0-9X]{10}$|' ,
 #                        '(?=(?:[0-9]+[- ]){3})[- 0-9X]{13}$|97[89][0-9]{10}$|' , 
@@ -0,0 +1,180 @@
+"""
+This module implements a persistent cache of the identifiers found in pdf files. Every time a valid identifier is found for a file,
+the result is stored in a sqlite database (see path_cache_file below), together with a hash of the whole content of the file, its size and
+its time of last modification. The next time that pdf2doi is called on the same (unchanged) file, even if the file has been renamed or moved
+in the meanwhile, the result is read from the database and none of the methods defined in finders.py (which parse the file and query
+several web servers) is used.
+The key of a file is computed from a blake2b hash of its whole content (see get_file_signature and get_key), hence, when the cache is enabled, 
+each file is read once in full before being analysed. The signature of a file is computed only once, and passed to get and store 
+(see main.py), unless the file is modified in the meanwhile (e.g. by adding the identifier to its metadata).
+The cache is disabled by default, both when pdf2doi is used as a library and from command line. It is enabled by setting 
+config.set('use_cache', True) (or with the argument -cache from command line). It can be emptied with the function clear() 
+(or with the argument -clear_cache from command line).
+The results are stored as JSON. The few values which JSON cannot represent (the FeedParserDict and struct_time objects in the info returned 
+by arxiv) are stored as tagged plain objects and restored when read (see to_json_object and from_json_object), so that a result read from 
+the cache has the same content and types as the one originally found.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from contextlib import closing
+import pdf2doi.config as config
+try:
+    import sqlite3
+except ImportError: #Some python distributions are compiled without sqlite3. In this case the cache is simply not used
+    sqlite3 = None
+
+logger = logging.getLogger("pdf2doi")
+
+path_cache_file = os.path.join(os.path.expanduser('~'), '.cache', 'pdf2doi', 'cache.sqlite')
+hash_chunk_size = 1 << 20 #Number of bytes read at a time when computing the hash of a file (see get_file_signature)
+
+#sqlite connections cannot be shared among threads, hence each thread opens its own connection (see get_connection)
+_thread_data = threading.local()
+_cache_unavailable = False #Set to True if the database cannot be opened, so that we do not try again for each file
+
+def get_connection():
+    """
+    Returns the connection to the database used by the current thread, creating it (and the database) if needed.
+    Returns None if the cache is disabled or if the database could not be opened.
+    """
+    global _cache_unavailable
+    if sqlite3 is None or _cache_unavailable or not config.get('use_cache'):
+        return None
+    connection = getattr(_thread_data, 'connection', None)
+    if connection is None:
+        try:
+            os.makedirs(os.path.dirname(path_cache_file), exist_ok=True)
+            connection = sqlite3.connect(path_cache_file, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL") #Allows one thread to write while the others read
+            connection.execute("CREATE TABLE IF NOT EXISTS identifiers (key TEXT PRIMARY KEY, result TEXT, ts INTEGER)")
+            connection.commit()
+        except Exception as e:
+            logger.error(f"It was not possible to open the cache file {path_cache_file}, the cache will not be used. Error: {e}")
+            _cache_unavailable = True
+            return None
+        _thread_data.connection = connection
+    return connection
+
+def get_file_signature(filename):
+    """
+    Returns a tuple (digest, mtime) for the file specified by filename, or (None, None) if the file cannot be accessed. The digest is a string 
+    identifying the content of the file, made of a hash of its whole content and of its size (files with the same content 
+    have the same digest, regardless of their names, and files with different contents have different digests), and mtime is its time 
+    of last modification in nanoseconds.
+    The size and the time of last modification are obtained from the open file, with a single system call.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            file_hash = hashlib.blake2b(digest_size=16)
+            for chunk in iter(lambda: f.read(hash_chunk_size), b''):
+                file_hash.update(chunk)
+    except OSError:
+        return None, None
+    return file_hash.hexdigest() + '-' + str(stat.st_size), stat.st_mtime_ns
+
+def get_key(filename, signature=None):
+    """
+    Returns the key under which the result of the file specified by filename is stored in the cache, or None if the file cannot be accessed.
+    The key is made of the digest of the file and of its time of last modification (see get_file_signature), and of the settings which affect 
+    the result. Hence, it changes if the file is modified, but not if the file is renamed or moved.
+    If the signature of the file was already computed, it can be passed as signature, so that the file is not read again.
+    """
+    digest, mtime = signature or get_file_signature(filename)
+    if digest is None:
+        return None
+    return json.dumps([digest, mtime, config.get('webvalidation'), config.get('method_dxdoiorg'), config.get('replace_arxivID_by_DOI_when_available')])
+
+def to_json_object(value):
+    """
+    Returns a copy of value made only of types which can be serialized to JSON. A struct_time is replaced by {'__struct_time__': [...]} 
+    and a FeedParserDict by {'__FeedParserDict__': {...}} (see from_json_object). Tuples become lists, and any other value which is not 
+    JSON serializable is replaced by its string representation.
+    """
+    if isinstance(value, time.struct_time):
+        return {'__struct_time__': list(value)}
+    if isinstance(value, dict):
+        converted = {str(k): to_json_object(v) for k, v in value.items()}
+        if type(value).__name__ == 'FeedParserDict':
+            return {'__FeedParserDict__': converted}
+        return converted
+    if isinstance(value, (list, tuple)):
+        return [to_json_object(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+def from_json_object(obj):
+    """
+    Used as object_hook of json.loads, it restores the objects replaced by to_json_object.
+    """
+    if '__struct_time__' in obj:
+        return time.struct_time(obj['__struct_time__'])
+    if '__FeedParserDict__' in obj:
+        import feedparser
+        return feedparser.FeedParserDict(obj['__FeedParserDict__'])
+    return obj
+
+def get(filename, signature=None):
+    """
+    Returns the result stored in the cache for the file specified by filename, or None if there is no (valid) result stored for this file.
+    signature is the signature of the file, if already known (see get_key).
+    """
+    connection = get_connection()
+    if connection is None:
+        return None
+    key = get_key(filename, signature)
+    if key is None:
+        return None
+    try:
+        row = connection.execute("SELECT result FROM identifiers WHERE key = ?", (key,)).fetchone()
+    except Exception as e:
+        logger.error(f"An error occurred while reading from the cache file {path_cache_file}: {e}")
+        return None
+    if row is None:
+        return None
+    try:
+        result = json.loads(row[0], object_hook=from_json_object)
+    except ValueError as e: #A corrupted (or outdated) entry is treated as a missing one
+        logger.error(f"An invalid entry was found in the cache file {path_cache_file}, and it was ignored: {e}")
+        return None
+    result['path'] = filename
+    return result
+
+def store(filename, result, signature=None):
+    """
+    Stores in the cache the result found for the file specified by filename. Only results containing a valid identifier are stored.
+    This function must be called after any modification of the file (e.g. after adding the identifier to its metadata).
+    signature is the signature of the file, if already known (see get_key). It must be computed after any modification of the file.
+    """
+    if not result.get('identifier'):
+        return
+    connection = get_connection()
+    if connection is None:
+        return
+    key = get_key(filename, signature)
+    if key is None:
+        return
+    try:
+        value = json.dumps(to_json_object({k: v for k, v in result.items() if not k == 'path'}))
+        connection.execute("INSERT OR REPLACE INTO identifiers (key, result, ts) VALUES (?, ?, ?)", (key, value, int(time.time())))
+        connection.commit()
+    except Exception as e:
+        logger.error(f"An error occurred while writing into the cache file {path_cache_file}: {e}")
+
+def clear():
+    """
+    Removes all the results stored in the cache. This is done even if the cache is currently disabled (see config.get('use_cache')).
+    """
+    if sqlite3 is None or not os.path.exists(path_cache_file):
+        return
+    try:
+        with closing(sqlite3.connect(path_cache_file, timeout=10)) as connection:
+            connection.execute("DELETE FROM identifiers")
+            connection.commit()
+    except Exception as e:
+        logger.error(f"An error occurred while clearing the cache file {path_cache_file}: {e}")
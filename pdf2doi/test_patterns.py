@@ -2,6 +2,7 @@ import pytest
 import re
 from pdf2doi.patterns import (
     doi_regexp,
+    doi_regexp_compiled,
     standardise_doi
 )
 
@@ -59,12 +60,36 @@ def test_standardise_doi(suspected, expected):
 ])
 def test_is_loose_doi_match(suspected, expected):
     print(suspected)
-    for ver, regex in enumerate(doi_regexp):
+    suspected = suspected.lower()
+    for ver, regex in enumerate(doi_regexp_compiled):
         
-        identifiers = re.findall(regex, suspected.lower())
+        identifiers = regex.findall(suspected)
         if identifiers:
             print(f"Matched with {ver} - {identifiers}")
             assert standardise_doi(identifiers[0]) == expected
             return
         print(f"{ver} failed.")
-    assert False
\ No newline at end of file
+    assert False
+
+@pytest.mark.parametrize(["suspected", "expected"], [
+    ["10.1038/s41586-019-1666-5abc", "10.1038/s41586-019-1666-5"],
+    ["text 10.1103/physrevlett.116.061102and more text", "10.1103/physrevlett.116.061102"],
+])
+def test_doi_followed_by_letters(suspected, expected):
+    identifiers = doi_regexp_compiled[2].findall(suspected.lower())
+    assert identifiers and identifiers[0] == expected
+
+def test_no_match_on_long_punctuation_sequences():
+    # A long sequence of dots/colons after a DOI-like prefix must be rejected (in linear time for version 2, whose first character class is bounded)
+    suspected = "10.1234/" + ".:" * 5000 + "!"
+    for regex in doi_regexp_compiled:
+        assert regex.findall(suspected) == []
+
+@pytest.mark.parametrize(["suspected", "expected"], [
+    ["10.1234/" + "a" * 10000 + "!", None],
+    ["10.1234/" + ".:" * 5000 + "!", None],
+    ["10.1234/" + "a" * 10000, "10.1234/" + "a" * 10000],
+])
+def test_standardise_long_doi_candidates(suspected, expected):
+    # Long near-DOI strings must be rejected (or accepted) in linear time by the verbose DOI regexp
+    assert standardise_doi(suspected) == expected
@@ -10,84 +10,127 @@ import os
 
 if os.name == 'nt':
     import winreg as reg
+    import ctypes
+    from ctypes import wintypes
 
 logger = logging.getLogger("pdf2doi")
 
+#Arguments of SHChangeNotify used to tell the Windows shell that the file associations (and thus the context menus) have changed
+SHCNE_ASSOCCHANGED = 0x08000000
+SHCNF_IDLIST = 0x0000
 
+#Access rights needed to delete a key together with its sub_keys and values (the standard right DELETE is not defined in winreg)
+DELETE = 0x00010000
+if os.name == 'nt':
+    key_delete_access = DELETE | reg.KEY_ENUMERATE_SUB_KEYS | reg.KEY_QUERY_VALUE | reg.KEY_SET_VALUE
 
-def delete_sub_key(key0, current_key, arch_key=0):
-    #Code inpsired by Orsiris de Jong's solution https://stackoverflow.com/questions/38205784/python-how-to-delete-registry-key-and-subkeys-from-hklm-getting-error-5
-    open_key = reg.OpenKey(key0, current_key, 0, reg.KEY_ALL_ACCESS | arch_key)
-    info_key = reg.QueryInfoKey(open_key)
-    for x in range(0, info_key[0]):
-        # NOTE:: This code is to delete the key and all sub_keys.
-        # If you just want to walk through them, then
-        # you should pass x to EnumKey. sub_key = reg.EnumKey(open_key, x)
-        # Deleting the sub_key will change the sub_key count used by EnumKey.
-        # We must always pass 0 to EnumKey so we
-        # always get back the new first sub_key.
-        sub_key =reg.EnumKey(open_key, 0)
-        try:
-            reg.DeleteKey(open_key, sub_key)
-            logger.info("Removed %s\\%s " % (current_key, sub_key))
-        except OSError:
-            delete_sub_key(key0, "\\".join([current_key,sub_key]), arch_key)
-            # No extra delete here since each call
-            # to delete_sub_key will try to delete itself when its empty.
 
-    reg.DeleteKey(open_key, "")
-    open_key.Close()
+
+#Keys added to the system registry by install_right_click, in the order in which they are created. Each element is a tuple 
+#(path of the key under HKEY_CLASSES_ROOT, default value of the key or None, dictionary of additional named values). The string {path_pdf2doi}
+#in the default values is replaced by the path of the pdf2doi executable
+right_click_keys = (
+    (r'Directory\shell\pdf2doi', None, {'MUIVerb': 'pdf2doi', 'subcommands': ''}),
+    (r'Directory\shell\pdf2doi\shell', None, {}),
+    (r'Directory\shell\pdf2doi\shell\pdf2doi_doi', 'Retrieve and copy DOIs/identifiers of all pdf files in this folder...', {}),
+    (r'Directory\shell\pdf2doi\shell\pdf2doi_doi\command', '{path_pdf2doi} "%1" -clip -v', {}),
+    (r'SystemFileAssociations\.pdf\shell\pdf2doi', None, {'MUIVerb': 'pdf2doi', 'subcommands': ''}),
+    (r'SystemFileAssociations\.pdf\shell\pdf2doi\shell', None, {}),
+    (r'SystemFileAssociations\.pdf\shell\pdf2doi\shell\pdf2doi_doi', 'Copy DOI/identifier of this file to clipboard...', {}),
+    (r'SystemFileAssociations\.pdf\shell\pdf2doi\shell\pdf2doi_doi\command', '{path_pdf2doi} "%1" -clip -v', {}),
+    (r'SystemFileAssociations\.pdf\shell\pdf2doi\shell\pdf2doi_setdoi', 'Set DOI/identifier of this file...', {}),
+    (r'SystemFileAssociations\.pdf\shell\pdf2doi\shell\pdf2doi_setdoi\command', '{path_pdf2doi} "%1" -id_input_box -v', {}),
+    )
+
+def get_RegDeleteTreeW():
+    #Returns the function RegDeleteTreeW of the Windows API (available since Windows Vista), or None if it is not available
+    try:
+        RegDeleteTreeW = ctypes.windll.advapi32.RegDeleteTreeW
+    except AttributeError:
+        return None
+    RegDeleteTreeW.argtypes = (wintypes.HKEY, wintypes.LPCWSTR)
+    RegDeleteTreeW.restype = wintypes.LONG
+    return RegDeleteTreeW
+
+def delete_sub_key(key0, current_key, arch_key=0):
+    #All the sub_keys and values of current_key are removed by the OS with a single call to RegDeleteTreeW, and then current_key itself 
+    #is deleted. If RegDeleteTreeW is not available, the tree of sub_keys is visited in python (see delete_sub_key_tree).
+    RegDeleteTreeW = get_RegDeleteTreeW()
+    if RegDeleteTreeW is None:
+        return delete_sub_key_tree(key0, current_key, arch_key)
+    with reg.OpenKey(key0, current_key, 0, key_delete_access | arch_key) as open_key:
+        error = RegDeleteTreeW(open_key.handle, None)
+        if error:
+            raise ctypes.WinError(error)
+        reg.DeleteKey(open_key, "")
     logger.info("Removed %s" % current_key)
     return
 
+def delete_sub_key_tree(key0, current_key, arch_key=0):
+    #Code inpsired by Orsiris de Jong's solution https://stackoverflow.com/questions/38205784/python-how-to-delete-registry-key-and-subkeys-from-hklm-getting-error-5
+    #The tree of sub_keys is visited depth-first with an explicit stack: a key is deleted as soon as it has no sub_keys left,
+    #otherwise its first sub_key is put on top of the stack and visited first.
+    stack = [current_key]
+    while stack:
+        key = stack[-1]
+        with reg.OpenKey(key0, key, 0, key_delete_access | arch_key) as open_key:
+            # Deleting a sub_key changes the indices used by EnumKey. 
+            # We must always pass 0 to EnumKey so we always get back the first sub_key still present (an OSError is raised if there is none).
+            try:
+                sub_key = reg.EnumKey(open_key, 0)
+            except OSError:
+                sub_key = None
+            if sub_key is not None:
+                stack.append(key + "\\" + sub_key)
+                continue
+            reg.DeleteKey(open_key, "")
+        logger.info("Removed %s" % key)
+        stack.pop()
+    return
+
+def get_path_pdf2doi():
+    #Returns the path of the pdf2doi executable, which is in the Scripts folder of the python installation
+    python_folder = path.dirname(python_path)
+    if path.basename(python_folder).lower() == 'scripts': #This typically happens when python is installed in a virtual environment
+        return path.join(python_folder, 'pdf2doi.exe')
+    return path.join(python_folder, 'Scripts', 'pdf2doi.exe')
+
+def notify_shell():
+    #Tells the Windows shell, once, that the keys of the context menu were changed
+    ctypes.windll.shell32.SHChangeNotify(SHCNE_ASSOCCHANGED, SHCNF_IDLIST, None, None)
+
+def is_right_click_installed(path_pdf2doi):
+    #Returns True if all the keys in right_click_keys already exist and contain the expected values (with the same path of the 
+    #pdf2doi executable), i.e. if there is nothing to add or repair
+    try:
+        for key_path, default_value, values in right_click_keys:
+            with reg.OpenKey(reg.HKEY_CLASSES_ROOT, key_path, 0, reg.KEY_READ) as key:
+                if default_value is not None and reg.QueryValueEx(key, '')[0] != default_value.format(path_pdf2doi=path_pdf2doi):
+                    return False
+                for name, value in values.items():
+                    if reg.QueryValueEx(key, name)[0] != value:
+                        return False
+    except OSError:
+        return False
+    return True
+
 def install_right_click():
     if not(os.name == 'nt'):
         logger.error(f'This functionality is currently implemented only for Windows.')
         return
-    python_folder = path.dirname(python_path)
-    if python_folder[-7:].lower() == 'scripts': #This typically happens when python is installed in a virtual environment
-        path_pdf2doi = python_folder + r"\pdf2doi.exe"
-    else:
-        path_pdf2doi = python_folder + r"\scripts\pdf2doi.exe"
+    path_pdf2doi = get_path_pdf2doi()
+    if is_right_click_installed(path_pdf2doi):
+        logger.info(f'pdf2doi is already in the right-click context menu, no key was added to the system register.')
+        return
     logger.info(f'Adding pdf2doi to the right-click context menu by adding keys to the system register...')
     try:
-
-        key = reg.CreateKey(reg.HKEY_CLASSES_ROOT, r'Directory\shell\pdf2doi')
-        reg.SetValueEx(key, 'MUIVerb', 0, reg.REG_SZ, r'pdf2doi')
-        reg.SetValueEx(key, 'subcommands', 0, reg.REG_SZ, '')
-        reg.CloseKey(key)
-        key = reg.CreateKey(reg.HKEY_CLASSES_ROOT, r'Directory\shell\pdf2doi\shell')
-        reg.CloseKey(key)
-
-        key = reg.CreateKey(reg.HKEY_CLASSES_ROOT, r'Directory\shell\pdf2doi\shell\pdf2doi_doi')
-        reg.SetValue(key, '', reg.REG_SZ, r'Retrieve and copy DOIs/identifiers of all pdf files in this folder...')
-        reg.CloseKey(key)
-        key = reg.CreateKey(reg.HKEY_CLASSES_ROOT, r'Directory\shell\pdf2doi\shell\pdf2doi_doi\command')
-        reg.SetValue(key, '', reg.REG_SZ, path_pdf2doi + " \"%1\" -clip -v")
-        reg.CloseKey(key)
-
-
-        key = reg.CreateKey(reg.HKEY_CLASSES_ROOT, r'SystemFileAssociations\.pdf\shell\pdf2doi')
-        reg.SetValueEx(key, 'MUIVerb', 0, reg.REG_SZ, 'pdf2doi')
-        reg.SetValueEx(key, 'subcommands', 0, reg.REG_SZ, '')
-        reg.CloseKey(key)
-        key = reg.CreateKey(reg.HKEY_CLASSES_ROOT, r'SystemFileAssociations\.pdf\shell\pdf2doi\shell')
-        reg.CloseKey(key)
-
-        key = reg.CreateKey(reg.HKEY_CLASSES_ROOT, r'SystemFileAssociations\.pdf\shell\pdf2doi\shell\pdf2doi_doi')
-        reg.SetValue(key, '', reg.REG_SZ, 'Copy DOI/identifier of this file to clipboard...')
-        reg.CloseKey(key)
-        key = reg.CreateKey(reg.HKEY_CLASSES_ROOT, r'SystemFileAssociations\.pdf\shell\pdf2doi\shell\pdf2doi_doi\command')
-        reg.SetValue(key, '', reg.REG_SZ, path_pdf2doi + " \"%1\" -clip -v")
-        reg.CloseKey(key)
-
-        key = reg.CreateKey(reg.HKEY_CLASSES_ROOT, r'SystemFileAssociations\.pdf\shell\pdf2doi\shell\pdf2doi_setdoi')
-        reg.SetValue(key, '', reg.REG_SZ, 'Set DOI/identifier of this file...')
-        reg.CloseKey(key)
-        key = reg.CreateKey(reg.HKEY_CLASSES_ROOT, r'SystemFileAssociations\.pdf\shell\pdf2doi\shell\pdf2doi_setdoi\command')
-        reg.SetValue(key, '', reg.REG_SZ, path_pdf2doi + " \"%1\" -id_input_box -v")
-        reg.CloseKey(key)
-
+        for key_path, default_value, values in right_click_keys:
+            with reg.CreateKeyEx(reg.HKEY_CLASSES_ROOT, key_path, 0, reg.KEY_WRITE) as key:
+                if default_value is not None:
+                    reg.SetValue(key, '', reg.REG_SZ, default_value.format(path_pdf2doi=path_pdf2doi))
+                for name, value in values.items():
+                    reg.SetValueEx(key, name, 0, reg.REG_SZ, value)
+        notify_shell()
         logger.info(f'All necessary keys were added to the system register.')
     except Exception as e:
         logger.error(e)
@@ -101,6 +144,7 @@ def uninstall_right_click():
     try:
         delete_sub_key(reg.HKEY_CLASSES_ROOT, r"SystemFileAssociations\.pdf\shell\pdf2doi")
         delete_sub_key(reg.HKEY_CLASSES_ROOT, r"Directory\shell\pdf2doi")
+        notify_shell()
         logger.info(f'All keys were removed.')
     except Exception as e:
         logger.error(e)
@@ -2,11 +2,11 @@ import setuptools
 from os import path
 
 this_directory = path.abspath(path.dirname(__file__))
-with open(path.join(this_directory, 'README.md'),encoding ='unicode_escape') as f:
+with open(path.join(this_directory, 'README.md'),encoding ='utf-8') as f:
     long_description = f.read()
 
-with open("requirements.txt") as f:
-    required_packages = f.read().splitlines()
+with open(path.join(this_directory, 'requirements.txt')) as f:
+    required_packages = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
 
 setuptools.setup(name='pdf2doi',
       version='1.7',
@@ -21,5 +21,6 @@ setuptools.setup(name='pdf2doi',
         'console_scripts': ["pdf2doi = pdf2doi.main:main"],
       },
       packages=['pdf2doi'],
+      python_requires = '>=3.9',
       install_requires = required_packages,
       zip_safe = False)
\ No newline at end of file